@@ -10,6 +10,9 @@ import shutil
 import re
 import math
 import json
+import hashlib
+import tempfile
+import concurrent.futures as cf
 import numpy as np
 import pandas as pd
 import collections
@@ -32,6 +35,11 @@ import jinja2 as ji
 import reeds_bokeh as rb
 import logging
 from pdb import set_trace as pdbst
+try:
+    import pyarrow as pa
+    import pyarrow.feather as paf
+except ImportError:
+    paf = None
 
 #Setup logger
 logger = logging.getLogger('')
@@ -82,6 +90,12 @@ MAP_BOUNDARY_WIDTH = 0.1
 MAP_LINE_WIDTH = 2
 RANGE_OPACITY_MULT = 0.3
 RANGE_GLYPH_MAP = {'Line': 'Area', 'Dot': 'Bar', 'Dot-Line': 'Area'}
+CSV_CACHE = True #Keep columnar (feather) copies of csv sources in cache_path. Requires pyarrow.
+#How create_maps builds exploded maps: 'serial', or 'thread' (thread pool). Maps are bokeh models, which can't be
+#built in worker processes, and building them holds the GIL for most of the time, so threads are opt-in.
+#MAP_BUILD_WORKERS is the maximum number of workers, or None for the concurrent.futures default.
+MAP_BUILD_MODE = 'serial'
+MAP_BUILD_WORKERS = None
 
 #List of widgets that use columns as their selectors
 WDG_COL = ['x', 'y', 'x_group', 'series', 'explode', 'explode_group']
@@ -97,17 +111,51 @@ WDG_NON_COL = ['chart_type', 'range', 'y_agg', 'adv_op', 'explode_grid', 'adv_co
     'map_arrows','map_arrow_size','map_arrow_loc','map_width', 'map_font_size', 'map_boundary_width',
     'map_line_width', 'map_opacity', 'map_palette', 'map_palette_2', 'map_palette_break']
 
+#List of widgets that only change properties of existing figure and glyph models. If nothing but these have changed
+#since the figures were built, update_plots patches the figures instead of rebuilding them (see patch_figures).
+STYLE_WDG = ['plot_title', 'plot_title_size', 'plot_width', 'plot_height', 'opacity', 'x_title', 'x_title_size',
+    'x_major_label_size', 'x_major_label_orientation', 'y_title', 'y_title_size', 'y_major_label_size',
+    'circle_size', 'line_width', 'bokeh_tools']
+
+#List of widgets that determine the structure of figures. While these are unchanged, update_plots keeps the current
+#figure, glyph, and source models and updates their data and properties (see sync_figures).
+STRUCTURE_WDG = ['x', 'y', 'x_group', 'series', 'explode', 'explode_group', 'chart_type', 'range', 'explode_grid']
+
+#Stages of set_df_plots, in order, with the widgets that each stage reads (see STAGE_FUNCS). The filter stage also
+#reads the filter widgets and, if there are fill columns, FILL_WDG. The sort stage also reads custom_sorts. The output of each stage is memoized in
+#GL['stage_cache'], and a stage only reruns if its widgets or those of an earlier stage have changed, so that e.g.
+#a style-only change skips straight to building the figures.
+PLOT_STAGES = collections.OrderedDict([
+    ('filter', []),
+    ('limit', ['series', 'series_limit', 'y']),
+    ('aggregate', ['x', 'x_group', 'series', 'explode', 'explode_group', 'y', 'y_agg', 'y_b', 'y_c', 'range', 'hist_num_bins', 'hist_weight', 'sync_axes']),
+    ('adv_ops', ['adv_op', 'adv_col', 'adv_col_base', 'adv_op2', 'adv_col2', 'adv_col_base2', 'adv_op3', 'adv_col3', 'adv_col_base3',
+        'x', 'y', 'y_agg', 'range', 'chart_type', 'map_arrows']),
+    ('scale', ['x', 'y', 'x_scale', 'y_scale']),
+    ('sort', ['x', 'x_group', 'series', 'explode', 'explode_group', 'y', 'range', 'sort_data', 'cum_sort', 'net_levels', 'chart_type']),
+    ('boxplot', ['x', 'x_group', 'series', 'explode', 'explode_group', 'y', 'range']),
+])
+#Widgets that decide which fill columns the filter stage fills along. See get_fill_dims.
+FILL_WDG = ['x', 'x_group', 'series', 'explode', 'explode_group', 'y', 'y_agg', 'range', 'sort_data']
+
 #initialize globals dict for variables that are modified within update functions.
 #custom_sorts (dict): Keys are column names and values are lists of values in the desired sort order
 #custom_colors (dict): Keys are column names and values are dicts that map column values to colors (hex strings)
+#stage_cache (dict): Memoized output of the stages of set_df_plots. See PLOT_STAGES.
+#figure_state (dict): What the current figures were built from, to decide if they can be patched. See update_plots.
+#bar_width_tables (dict): Bar widths read from _bar_width files, with their modification times. See get_bar_widths.
+#gis (dict): Projected map geometry of each region type that has been mapped. See get_gis.
+#load_filters (dict): Filters applied as the data of a static report is loaded. See get_load_filters.
+#filter_codes (dict): Integer codes of the filterable columns of the source, and the source they are from. See get_filter_codes.
 GL = {'df_source':None, 'df_plots':None, 'columns':None, 'data_source_wdg':None, 'variant_wdg':{},
       'widgets':None, 'wdg_defaults': collections.OrderedDict(), 'controls': None, 'plots':None, 'custom_sorts': DEFAULT_CUSTOM_SORTS,
-      'custom_colors': DEFAULT_CUSTOM_COLORS}
+      'custom_colors': DEFAULT_CUSTOM_COLORS, 'stage_cache': {}, 'figure_state': {}, 'bar_width_tables': {}, 'gis': {}, 'load_filters': {}, 'filter_codes': {}}
 
 #os globals
 this_dir_path = os.path.dirname(os.path.realpath(__file__))
 runs_path = os.path.dirname(this_dir_path) + r'\runs'
 out_path = this_dir_path + '/out'
+cache_path = this_dir_path + '/cache'
 
 def initialize():
     '''
@@ -177,6 +225,8 @@ def static_report(data_type, data_source, static_presets, report_path, report_fo
     GL['data_source_wdg'] = build_data_source_wdg()
     GL['controls'] = bl.column(list(GL['data_source_wdg'].values()))
     GL['plots'] = bl.column([])
+    #Filters shared by all sections are applied as the data is loaded
+    GL['load_filters'] = get_load_filters(static_presets)
     #Update data source widget with input value
     GL['data_source_wdg']['data_type'].value = data_type
     GL['data_source_wdg']['data'].value = data_source
@@ -313,6 +363,38 @@ def static_report(data_type, data_source, static_presets, report_path, report_fo
                 sp.Popen(os.path.abspath(html_path), shell=True)
     logger.info('***Done building report')
 
+def get_load_filters(static_presets):
+    '''
+    Find the filters of a static report that can be applied as its data is loaded, so that rows that no section
+    shows are never materialized. A column is filtered if every section of a ReEDS result (or of the data source,
+    for other data types) filters it with a list of labels, and the labels are the union of these lists. Nothing
+    is filtered for a result if one of its sections downloads the full source or selects filter values by position
+    ('last', 'start', 'end'), because these depend on all values of the source.
+
+    Args:
+        static_presets (list of dicts): Presets of the report. See static_report().
+
+    Returns:
+        load_filters (dict): Keys are ReEDS result names (None for other data types), and values are dicts with
+            column names as keys and lists of filter labels as values.
+    '''
+    sections = collections.OrderedDict()
+    for static_preset in static_presets:
+        sections.setdefault(static_preset['config'].get('result'), []).append(static_preset)
+    load_filters = {}
+    for result, presets in sections.items():
+        if any(p.get('download_full_source') == True for p in presets):
+            continue
+        filters = [p['config'].get('filter', {}) for p in presets]
+        if any(isinstance(f, str) or (isinstance(f, dict) and ('start' in f or 'end' in f)) for fil in filters for f in fil.values()):
+            continue
+        load_filter = {}
+        for col in filters[0]:
+            if all(isinstance(fil.get(col), list) for fil in filters):
+                load_filter[col] = list(collections.OrderedDict.fromkeys(str(lab) for fil in filters for lab in fil[col]))
+        load_filters[result] = load_filter
+    return load_filters
+
 def preset_wdg(preset, download_full_source=False):
     '''
     Reset widgets and then set them to that specified in input preset
@@ -406,15 +488,18 @@ def build_data_source_wdg(data_type=DEFAULT_DATA_TYPE, data_source=runs_path):
     wdg['data'].on_change('value', update_data)
     return wdg
 
-def get_df_csv(data_source):
+def get_df_csv(data_source, row_filter={}, custom_sorts={}):
     '''
     Read csv(s) into a pandas dataframe, and determine which columns of the dataframe
     are discrete (strings), continuous (numbers), able to be filtered (aka filterable),
     and able to be used as a series (aka seriesable). NA values are filled based on the type of column,
-    and the dataframe and columns are returned.
+    discrete columns are encoded as categoricals (see get_categorical()), and the dataframe and columns are returned.
 
     Args:
         data_source (string): Path to csv file or directory containing csv files with the same column structure
+        row_filter (dict): Optional filters to apply as the csvs are read. Keys are column names and values are lists
+            of filter labels. A 'filename' filter skips whole files. See read_csv_cached().
+        custom_sorts (dict): Keys are column names. Values are lists of values in the desired sort order.
 
     Returns:
         df_source (pandas dataframe): A dataframe of the source, with filled NA values.
@@ -424,24 +509,32 @@ def get_df_csv(data_source):
     logger.info('***Fetching csv(s)...')
     dfs = []
     sources = data_source.split('|')
+    #the filename column is added below, so its filter is applied to whole files
+    file_filter = {col: labels for col, labels in row_filter.items() if col != 'filename'}
+    filenames = row_filter.get('filename')
     for src in sources:
         src = src.strip()
         if os.path.isdir(src):
             #if this is a directory, get all csv within it, assuming they are structured the same way, and add a column for filename
             for file in os.listdir(src):
                 if file.endswith(".csv"):
-                    filepath = os.path.join(src,file)
-                    df = pd.read_csv(filepath, low_memory=False)
                     filename = os.path.splitext(file)[0]
+                    if filenames is not None and filename not in filenames:
+                        continue
+                    filepath = os.path.join(src,file)
+                    df = read_csv_cached(filepath, file_filter, low_memory=False)
                     df['filename'] = filename
                     dfs.append(df)
+        elif len(sources) > 1:
+            filename = os.path.splitext(os.path.basename(src))[0]
+            if filenames is not None and filename not in filenames:
+                continue
+            df = read_csv_cached(src, file_filter, low_memory=False)
+            df['filename'] = filename
+            dfs.append(df)
         else:
             #This is a csv file, or pd.read_csv will show error if it isn't
-            df = pd.read_csv(src, low_memory=False)
-            if len(sources) > 1:
-                filename = os.path.splitext(os.path.basename(src))[0]
-                df['filename'] = filename
-            dfs.append(df)
+            dfs.append(read_csv_cached(src, row_filter, low_memory=False))
     df_source = pd.concat(dfs,sort=False,ignore_index=True)
     cols = {}
     cols['all'] = df_source.columns.values.tolist()
@@ -453,9 +546,183 @@ def get_df_csv(data_source):
     cols['seriesable'] = cols['filterable']
     df_source[cols['discrete']] = df_source[cols['discrete']].fillna('{BLANK}')
     df_source[cols['continuous']] = df_source[cols['continuous']].fillna(0)
+    for col in cols['discrete']:
+        df_source[col] = get_categorical(df_source[col], custom_sorts.get(col, []))
     logger.info('***Done fetching csv(s).')
     return (df_source, cols)
 
+def get_categorical(ser, sort_order=[]):
+    '''
+    Encode a discrete column as a pandas categorical, so that filters, groupbys and sorts work on integer codes
+    and the source takes much less memory. The categories are the values of sort_order (e.g. a custom sort)
+    that are in the column, followed by the other values in sorted order.
+
+    Args:
+        ser (pandas series): Discrete column, with NA values filled.
+        sort_order (list): Values in the desired order of the categories.
+
+    Returns:
+        ser (pandas series): The categorical column.
+    '''
+    ser = ser.astype('category')
+    if sort_order:
+        categories = ser.cat.categories
+        ordered = pd.Index(sort_order).drop_duplicates()
+        ordered = ordered[ordered.isin(categories)]
+        ser = ser.cat.reorder_categories(ordered.append(categories[~categories.isin(ordered)]))
+    return ser
+
+def read_csv_cached(filepath, row_filter={}, **kw):
+    '''
+    Read a csv file with pd.read_csv(), using a columnar (feather) copy of the file in cache_path if there is one
+    for the current size and modification time of the file. Otherwise the csv is parsed and the copy is written,
+    with string columns stored as categoricals and integer columns downcast. The copy is memory-mapped when read,
+    and the original dtypes are restored, so the returned dataframe is the same as from pd.read_csv().
+
+    If there is a row filter, only the filtered columns of the copy are read to find the rows to keep, and the other
+    rows are never converted to pandas. Without a copy, the whole csv is parsed and then filtered, so that column
+    types are inferred from all rows as they are by pd.read_csv(). See get_csv_filter_mask().
+
+    Args:
+        filepath (string): Path to csv file.
+        row_filter (dict): Optional. Keys are column names and values are lists of filter labels. This is not
+            part of the cache key, as the copy always holds the whole csv.
+        kw: Keyword arguments for pd.read_csv(). These are part of the cache key.
+
+    Returns:
+        df (pandas dataframe): The contents of the csv file.
+    '''
+    if not CSV_CACHE or paf is None:
+        df = pd.read_csv(filepath, **kw)
+        if row_filter:
+            df = df[get_csv_filter_mask(df, row_filter)].reset_index(drop=True)
+        return df
+    abs_path = os.path.abspath(filepath)
+    stat = os.stat(abs_path)
+    key = hashlib.sha1((abs_path + '|' + repr(sorted(kw.items()))).encode('utf-8')).hexdigest()
+    cache_file = cache_path + '/' + key + '-' + str(stat.st_size) + '-' + str(stat.st_mtime_ns) + '.feather'
+    if os.path.isfile(cache_file):
+        try:
+            table = paf.read_table(cache_file, memory_map=True)
+            filter_cols = [col for col in row_filter if col in table.column_names]
+            if filter_cols:
+                table = table.filter(pa.array(get_csv_filter_mask(table.select(filter_cols).to_pandas(), row_filter)))
+            df = table.to_pandas()
+            dtypes = json.loads(table.schema.metadata[b'csv_dtypes'])
+            for col in df.columns:
+                if str(df[col].dtype) != dtypes[col]:
+                    df[col] = df[col].astype(dtypes[col])
+            return df
+        except Exception as e:
+            logger.info('***Warning: could not read cached copy of ' + abs_path + ': ' + str(e))
+    df = pd.read_csv(abs_path, **kw)
+    write_csv_cache(df, key, cache_file, abs_path)
+    if row_filter:
+        df = df[get_csv_filter_mask(df, row_filter)].reset_index(drop=True)
+    return df
+
+def get_csv_filter_mask(df, row_filter):
+    '''
+    Find the rows of a csv dataframe that pass a row filter. Only string columns are filtered. Integer columns are
+    not, because get_df_csv() decides whether they are filterable from the number of values in the whole source,
+    which isn't known while one file is read.
+
+    Args:
+        df (pandas dataframe): The csv dataframe, or some of its columns. String columns may be categorical.
+        row_filter (dict): Keys are column names and values are lists of filter labels.
+
+    Returns:
+        mask (numpy array): Boolean mask of the rows to keep.
+    '''
+    csv_filter = {}
+    for col, labels in row_filter.items():
+        if col not in df.columns:
+            continue
+        dtype = df[col].dtype
+        if dtype == object or isinstance(dtype, pd.CategoricalDtype):
+            csv_filter[col] = labels
+    return get_filter_mask(df, csv_filter)
+
+def get_filter_mask(df, row_filter):
+    '''
+    Find the rows of a dataframe whose values are among the labels of a row filter. Values are matched to labels
+    by their string form, as filter widget labels are made in build_widgets(), and missing values pass if they could
+    have been filled with one of the labels. Rows that pass are filtered again by filter_df(), so it's fine if a
+    mask keeps a few rows that the filter widgets would not.
+
+    Args:
+        df (pandas dataframe): Dataframe to filter.
+        row_filter (dict): Keys are column names and values are lists of filter labels. Columns that aren't in
+            df are ignored.
+
+    Returns:
+        mask (numpy array): Boolean mask of the rows to keep.
+    '''
+    mask = np.ones(len(df), dtype=bool)
+    for col, labels in row_filter.items():
+        if col not in df.columns:
+            continue
+        labels = set(str(lab) for lab in labels)
+        vals = pd.unique(df[col].dropna())
+        keep = df[col].isin([v for v in vals if str(v) in labels]).values
+        if '{BLANK}' in labels or '0' in labels:
+            keep = keep | df[col].isna().values
+        mask &= keep
+    return mask
+
+def write_csv_cache(df, key, cache_file, csv_path):
+    '''
+    Write the compact columnar copy of a csv dataframe for read_csv_cached(), and remove outdated copies
+    of the same csv and copies of csvs that no longer exist (see prune_csv_cache()). The copy is written to a uniquely
+    named temporary file first, so sessions that cache the same csv at once don't write to the same file. Dataframes
+    that can't be stored in feather format (e.g. non-string column names or columns of mixed types) are not cached.
+    '''
+    if not all(isinstance(c, str) for c in df.columns):
+        return
+    df_cache = pd.DataFrame(index=df.index)
+    for col in df.columns:
+        if df[col].dtype == object:
+            df_cache[col] = df[col].astype('category')
+        elif pd.api.types.is_integer_dtype(df[col].dtype):
+            df_cache[col] = pd.to_numeric(df[col], downcast='integer')
+        else:
+            df_cache[col] = df[col]
+    tmp_file = None
+    try:
+        table = pa.Table.from_pandas(df_cache, preserve_index=False)
+        dtypes = json.dumps({col: str(df[col].dtype) for col in df.columns})
+        table = table.replace_schema_metadata(dict(table.schema.metadata or {}, csv_dtypes=dtypes, csv_path=csv_path))
+        if not os.path.isdir(cache_path):
+            os.makedirs(cache_path)
+        prune_csv_cache(key)
+        fd, tmp_file = tempfile.mkstemp(suffix='.tmp', dir=cache_path)
+        os.close(fd)
+        paf.write_feather(table, tmp_file)
+        os.replace(tmp_file, cache_file)
+    except Exception as e:
+        logger.info('***Warning: could not cache ' + cache_file + ': ' + str(e))
+        if tmp_file is not None and os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+
+def prune_csv_cache(key):
+    '''
+    Remove the cached copies of the csv with cache key key, and cached copies whose csv (the csv_path in their schema
+    metadata) no longer exists. Copies that are in use by another session and can't be removed are left.
+    '''
+    for f in os.listdir(cache_path):
+        if not f.endswith('.feather'):
+            continue
+        filepath = cache_path + '/' + f
+        try:
+            if not f.startswith(key + '-'):
+                with pa.memory_map(filepath) as source:
+                    metadata = pa.ipc.open_file(source).schema.metadata or {}
+                if b'csv_path' in metadata and os.path.isfile(metadata[b'csv_path'].decode('utf-8')):
+                    continue
+            os.remove(filepath)
+        except (OSError, pa.ArrowException):
+            pass
+
 def get_wdg_csv():
     '''
     Create report widgets for csv file.
@@ -717,64 +984,188 @@ def save_wdg_defaults(wdg, wdg_defaults):
         elif isinstance(wdg[key], bmw.inputs.InputWidget):
             wdg_defaults[key] = wdg[key].value
 
-def set_df_plots(df_source, cols, wdg, custom_sorts={}):
+def set_df_plots(df_source, cols, wdg, custom_sorts={}, stage_cache=None):
     '''
     Apply filters, scaling, aggregation, and sorting to source dataframe, and return the result.
+    This runs the stages in PLOT_STAGES in order. If stage_cache is given, the output of each stage is
+    memoized there, and stages whose widgets haven't changed since the last call are not rerun.
 
     Args:
         df_source (pandas dataframe): Dataframe of the csv source.
         cols (dict): Keys are categories of columns of df_source, and values are a list of columns of that category.
         wdg (ordered dict): Dictionary of bokeh model widgets.
         custom_sorts (dict): Keys are column names. Values are lists of values in the desired sort order.
+        stage_cache (dict, optional): Keys are stage names and values are tuples of the stage key and output from
+            the last call. Stages are rerun from the first one whose key has changed.
 
     Returns:
         df_plots (pandas dataframe): df_source after having been filtered, scaled, aggregated, and sorted.
     '''
     logger.info('***Filtering, Scaling, Aggregating, Adv Operations, Sorting...')
     startTime = datetime.datetime.now()
-    df_plots = df_source.copy()
+    if stage_cache is not None and (stage_cache.get('source') is not df_source or stage_cache.get('columns') is not cols):
+        stage_cache.clear()
+        stage_cache['source'] = df_source
+        stage_cache['columns'] = cols
+    df_plots = df_source
+    key = ()
+    for stage, stage_wdgs in PLOT_STAGES.items():
+        key += (get_stage_key(stage, stage_wdgs, wdg, cols, custom_sorts),)
+        if stage_cache is not None and stage in stage_cache and stage_cache[stage][0] == key:
+            df_plots = stage_cache[stage][1]
+        else:
+            df_plots = STAGE_FUNCS[stage](df_plots, wdg, cols, custom_sorts)
+            if stage_cache is not None:
+                stage_cache[stage] = (key, df_plots)
+        if stage == 'filter' and df_plots.empty:
+            return df_plots
+    logger.info('***Done Filtering, Scaling, Aggregating, Adv Operations, Sorting: '+ str(datetime.datetime.now() - startTime))
+    if wdg['render_plots'].value == 'No':
+        logger.info('***Ready for download!')
+    return df_plots
 
-    #Apply filters
+def get_stage_key(stage, stage_wdgs, wdg, cols, custom_sorts):
+    '''
+    Return a hashable snapshot of everything a stage of set_df_plots reads from the widgets.
+
+    Args:
+        stage (string): Name of the stage, a key of PLOT_STAGES.
+        stage_wdgs (list): Keys of the widgets that the stage reads.
+        wdg (ordered dict): Dictionary of bokeh model widgets.
+        cols (dict): Keys are categories of columns of df_source, and values are a list of columns of that category.
+        custom_sorts (dict): Keys are column names. Values are lists of values in the desired sort order.
+
+    Returns:
+        key (tuple): Widget values of the stage.
+    '''
+    key = tuple(wdg[w].value for w in stage_wdgs)
+    if stage == 'filter':
+        key += tuple(tuple(wdg['filter_'+str(j)].active) for j in range(len(cols['filterable'])))
+        if cols.get('fill'):
+            key += tuple(wdg[w].value for w in FILL_WDG)
+    elif stage == 'sort':
+        key += (repr(sorted(custom_sorts.items())),)
+    return key
+
+def get_groupby_cols(wdg):
+    '''
+    Return the columns that define a point in the plots: x, x_group, series, explode, and explode_group, if set.
+    For histograms, x is added after the bins are made, and x_group is not used.
+    '''
+    groupby_cols = [wdg['x'].value]
+    if wdg['x_group'].value != 'None' and wdg['x'].value != 'histogram_x': groupby_cols = [wdg['x_group'].value] + groupby_cols
+    if wdg['series'].value != 'None': groupby_cols = [wdg['series'].value] + groupby_cols
+    if wdg['explode'].value != 'None': groupby_cols = [wdg['explode'].value] + groupby_cols
+    if wdg['explode_group'].value != 'None': groupby_cols = [wdg['explode_group'].value] + groupby_cols
+    return groupby_cols
+
+def filter_df(df_source, wdg, cols, custom_sorts):
+    '''
+    Stage of set_df_plots: Apply filters, and fill missing values with 0 for the filtered combinations of fill columns
+    (see fill_missing and get_fill_dims). The filters are combined into one mask over the integer codes of the filtered
+    columns (see get_filter_codes), and the rows are taken from the source once. If nothing is filtered out, the source
+    itself is returned.
+    '''
+    mask = None
+    filters = {}
     for j, col in enumerate(cols['filterable']):
         active = [wdg['filter_'+str(j)].labels[i] for i in wdg['filter_'+str(j)].active]
         if col in cols['continuous']:
             active = np.asarray(active)
-            active = active.astype(df_plots[col].dtype)
+            active = active.astype(df_source[col].dtype)
             active = active.tolist()
-        df_plots = df_plots[df_plots[col].isin(active)]
+        codes, uniques = get_filter_codes(df_source, col)
+        allowed = uniques.isin(active)
+        if allowed.all():
+            continue
+        filters[col] = active
+        #the extra False is the lookup for missing values, which have code -1
+        keep = np.append(allowed, False)[codes]
+        mask = keep if mask is None else mask & keep
+    df_plots = df_source if mask is None else df_source.take(np.flatnonzero(mask))
+    if cols.get('fill'):
+        df_plots = fill_missing(df_plots, df_source, cols, filters, get_fill_dims(wdg, cols, filters))
+    return df_plots
 
-    if df_plots.empty:
-        return df_plots
+def get_fill_dims(wdg, cols, filters):
+    '''
+    Return the fill columns that fill_missing needs to fill along for the current plots. With sum(a) aggregation
+    of a y column that is not a fill column, zero rows only decide which points of the plots exist, so only the plotted
+    fill columns are needed, along with the join keys of plotted or filtered joined columns (see cols['fill_keys']).
+    Otherwise, e.g. without aggregation, with ave(a) or ratios (whose b and c columns may be fill columns), within-series
+    ranges or histograms, or if a plotted column is not a fill or joined column, every zero row counts and all fill
+    columns are needed. They are also needed if the data isn't sorted, as the points are then in the order of the rows.
+
+    Args:
+        wdg (ordered dict): Dictionary of bokeh model widgets.
+        cols (dict): Keys are categories of columns of df_source, and values are a list of columns of that category.
+        filters (dict): Keys are filtered columns and values are lists of active filter values.
+
+    Returns:
+        fill_dims (list): Fill columns to fill along, in the order of cols['fill'].
+    '''
+    fill_keys = cols.get('fill_keys', {})
+    plot_cols = get_groupby_cols(wdg)
+    if (wdg['y'].value not in cols['continuous'] or wdg['y'].value in cols['fill'] or wdg['y_agg'].value != 'sum(a)' or
+            wdg['x'].value == 'histogram_x' or wdg['range'].value == 'Within Series' or wdg['sort_data'].value != 'Yes' or any(c not in cols['fill'] and c not in fill_keys for c in plot_cols)):
+        return cols['fill']
+    dims = set(plot_cols)
+    dims.update(key for col, key in fill_keys.items() if col in plot_cols or col in filters)
+    return [c for c in cols['fill'] if c in dims]
+
+def get_filter_codes(df_source, col):
+    '''
+    Return integer codes for the values of a filterable column of the source. Categorical columns use their own
+    codes, and other columns are factorized once per source and kept in GL['filter_codes'].
+
+    Args:
+        df_source (pandas dataframe): Dataframe of the source.
+        col (string): Name of the column.
 
-    #Limit number of series if indicated
+    Returns:
+        codes (numpy array): Code of each row of df_source. Missing values have code -1.
+        uniques (pandas index): Value of each code.
+    '''
+    if isinstance(df_source[col].dtype, pd.CategoricalDtype):
+        return (df_source[col].cat.codes.values, df_source[col].cat.categories)
+    cache = GL['filter_codes']
+    if cache.get('source') is not df_source:
+        cache.clear()
+        cache['source'] = df_source
+    if col not in cache:
+        codes, uniques = pd.factorize(df_source[col])
+        cache[col] = (codes, pd.Index(uniques))
+    return cache[col]
+
+def limit_series(df_plots, wdg, cols, custom_sorts):
+    '''
+    Stage of set_df_plots: Limit number of series if indicated, grouping the rest into 'Other'.
+    '''
     if wdg['series'].value != 'None' and wdg['series_limit'].value.isdigit():
         df_top = df_plots[[wdg['series'].value, wdg['y'].value]].copy()
         df_top[wdg['y'].value] = df_top[wdg['y'].value].abs()
-        df_top = df_top.groupby([wdg['series'].value], sort=False, as_index=False).sum()
+        df_top = df_top.groupby([wdg['series'].value], sort=False, observed=True, as_index=False).sum()
         df_top = df_top.sort_values(by=[wdg['y'].value], ascending=False)
         top_series = df_top.head(int(wdg['series_limit'].value))[wdg['series'].value].tolist()
+        df_plots = df_plots.copy()
+        if isinstance(df_plots[wdg['series'].value].dtype, pd.CategoricalDtype) and 'Other' not in df_plots[wdg['series'].value].cat.categories:
+            df_plots[wdg['series'].value] = df_plots[wdg['series'].value].cat.add_categories(['Other'])
         df_plots.loc[~df_plots[wdg['series'].value].isin(top_series), wdg['series'].value] = 'Other'
+    return df_plots
 
-    #Apply Aggregation
+def aggregate_df(df_plots, wdg, cols, custom_sorts):
+    '''
+    Stage of set_df_plots: Apply aggregation, or make histogram.
+    '''
     if wdg['y'].value in cols['continuous'] and wdg['y_agg'].value != 'None' and wdg['x'].value != 'histogram_x':
-        groupby_cols = [wdg['x'].value]
-        if wdg['x_group'].value != 'None': groupby_cols = [wdg['x_group'].value] + groupby_cols
-        if wdg['series'].value != 'None': groupby_cols = [wdg['series'].value] + groupby_cols
-        if wdg['explode'].value != 'None': groupby_cols = [wdg['explode'].value] + groupby_cols
-        if wdg['explode_group'].value != 'None': groupby_cols = [wdg['explode_group'].value] + groupby_cols
-        df_grouped = df_plots.groupby(groupby_cols, sort=False)
-        df_plots = df_grouped.apply(apply_aggregation, wdg['y_agg'].value, wdg['y'].value, wdg['y_b'].value, wdg['y_c'].value, wdg['range'].value).reset_index()
-        #The index of each group's dataframe is added as another column it seems. So we need to remove it:
-        df_plots.drop(df_plots.columns[len(groupby_cols)], axis=1, inplace=True)
+        groupby_cols = get_groupby_cols(wdg)
+        df_plots = apply_aggregation(df_plots, groupby_cols, wdg['y_agg'].value, wdg['y'].value, wdg['y_b'].value, wdg['y_c'].value, wdg['range'].value)
 
     #Make histogram
     if wdg['x'].value == 'histogram_x':
         weights = df_plots[wdg['y'].value] if  wdg['hist_weight'].value == 'Yes' else None
         yhist, binedges = np.histogram(df_plots[wdg['y'].value], bins=int(wdg['hist_num_bins'].value), weights=weights)
-        groupby_cols = []
-        if wdg['series'].value != 'None': groupby_cols = [wdg['series'].value] + groupby_cols
-        if wdg['explode'].value != 'None': groupby_cols = [wdg['explode'].value] + groupby_cols
-        if wdg['explode_group'].value != 'None': groupby_cols = [wdg['explode_group'].value] + groupby_cols
+        groupby_cols = get_groupby_cols(wdg)[:-1]
         if groupby_cols == []:
             bincenters = np.mean(np.vstack([binedges[0:-1],binedges[1:]]), axis=0)
             df_plots = pd.DataFrame({wdg['x'].value: bincenters, wdg['y'].value: yhist})
@@ -787,34 +1178,53 @@ def set_df_plots(df_source, cols, wdg, custom_sorts={}):
                     yhist, binedges = np.histogram(group[wdg['y'].value], bins=int(wdg['hist_num_bins'].value), weights=weights)
                 bincenters = np.mean(np.vstack([binedges[0:-1],binedges[1:]]), axis=0)
                 return pd.DataFrame({wdg['x'].value: bincenters, wdg['y'].value: yhist})
-            df_grouped = df_plots.groupby(groupby_cols, sort=False)
+            df_grouped = df_plots.groupby(groupby_cols, sort=False, observed=True)
             df_plots = df_grouped.apply(group_apply_hist, binedges).reset_index()
             df_plots.drop(df_plots.columns[len(groupby_cols)], axis=1, inplace=True)
-        groupby_cols += [wdg['x'].value]
-
-    #Check for range chart
-    range_cols = []
-    if wdg['range'].value == 'Within Series':
-        range_cols = ['range_min', 'range_max']
+    return df_plots
 
-    #Do Advanced Operations
+def adv_ops_df(df_plots, wdg, cols, custom_sorts):
+    '''
+    Stage of set_df_plots: Do advanced operations, and flip arrows of line maps.
+    '''
     df_plots = do_op(df_plots, wdg, cols, '')
     df_plots = do_op(df_plots, wdg, cols, '2')
     df_plots = do_op(df_plots, wdg, cols, '3')
 
     #For arrow maps, flip the x axis when there are negatives so that all values are positive in the correct direction.
     if wdg['chart_type'].value == 'Line Map' and wdg['map_arrows'].value == 'Yes':
+        df_plots = df_plots.copy()
+        df_plots[wdg['x'].value] = df_plots[wdg['x'].value].astype(object)
         df_plots[['temp_from','temp_to']] = df_plots[wdg['x'].value].str.split('-',expand=True)
         idx_neg = df_plots[wdg['y'].value] < 0
         df_plots.loc[idx_neg, wdg['x'].value] = df_plots.loc[idx_neg, 'temp_to'] + '-' + df_plots.loc[idx_neg, 'temp_from']
         df_plots[wdg['y'].value] = df_plots[wdg['y'].value].abs()
         df_plots.drop(['temp_from','temp_to'], axis='columns',inplace=True)
+    return df_plots
 
-    #Scale Axes
-    if wdg['x_scale'].value != '' and wdg['x'].value in cols['continuous'] + ['histogram_x']:
+def scale_df(df_plots, wdg, cols, custom_sorts):
+    '''
+    Stage of set_df_plots: Scale axes.
+    '''
+    scale_x = wdg['x_scale'].value != '' and wdg['x'].value in cols['continuous'] + ['histogram_x']
+    scale_y = wdg['y_scale'].value != '' and wdg['y'].value in cols['continuous']
+    if scale_x or scale_y:
+        df_plots = df_plots.copy()
+    if scale_x:
         df_plots[wdg['x'].value] = df_plots[wdg['x'].value] * float(wdg['x_scale'].value)
-    if wdg['y_scale'].value != '' and wdg['y'].value in cols['continuous']:
+    if scale_y:
         df_plots[wdg['y'].value] = df_plots[wdg['y'].value] * float(wdg['y_scale'].value)
+    return df_plots
+
+def sort_df(df_plots, wdg, cols, custom_sorts):
+    '''
+    Stage of set_df_plots: Sort by cumulative y and add net levels if indicated, sort, and order columns for csv download.
+    '''
+    df_plots = df_plots.copy()
+    #Check for range chart
+    range_cols = []
+    if wdg['range'].value == 'Within Series':
+        range_cols = ['range_min', 'range_max']
 
     #For cum_sort set to "Ascending" or "Descending" we will sort by cumulative y value.
     #If net levels are shown, we must also calculate cumulative y value.
@@ -822,10 +1232,10 @@ def set_df_plots(df_source, cols, wdg, custom_sorts={}):
     net_level_cond = wdg['net_levels'].value == 'Yes' and wdg['chart_type'].value in STACKEDTYPES
     net_level_col = []
     if cum_sort_cond or net_level_cond:
-        #adjust groupby_cols from Aggregation section above, and remove series from group if it is there
-        net_group_cols = [c for c in groupby_cols if c != wdg['series'].value]
+        #use the groupby columns of the aggregation stage, and remove series from group if it is there
+        net_group_cols = [c for c in get_groupby_cols(wdg) if c != wdg['series'].value]
         #group and sum across series to get the cumulative y for each x
-        df_net_group = df_plots.groupby(net_group_cols, sort=False)
+        df_net_group = df_plots.groupby(net_group_cols, sort=False, observed=True)
         df_net = df_net_group[wdg['y'].value].sum().reset_index()
         if cum_sort_cond:
             df_cum = df_net.rename(columns={wdg['y'].value: 'y_cumulative'})
@@ -848,14 +1258,21 @@ def set_df_plots(df_source, cols, wdg, custom_sorts={}):
         if cum_sort_cond: sortby_cols = ['y_cumulative'] + sortby_cols
         if wdg['explode'].value != 'None': sortby_cols = [wdg['explode'].value] + sortby_cols
         if wdg['explode_group'].value != 'None': sortby_cols = [wdg['explode_group'].value] + sortby_cols
-        #Add custom sort columns
+        #Add custom sort columns, with the position of each value in the custom sort (values that aren't in the custom
+        #sort go at the end). Categorical columns are sorted by their codes if their categories are in sorted order,
+        #and otherwise by their values.
         temp_sort_cols = sortby_cols[:]
-        for col in custom_sorts:
-            if col in sortby_cols:
-                df_plots[col + '__sort_col'] = df_plots[col].map(lambda x: custom_sorts[col].index(x))
+        for col in sortby_cols:
+            if col in custom_sorts:
+                sort_order = pd.Index(custom_sorts[col]).drop_duplicates()
+                sort_pos = sort_order.get_indexer(df_plots[col])
+                df_plots[col + '__sort_col'] = np.where(sort_pos < 0, len(sort_order), sort_pos)
                 temp_sort_cols[sortby_cols.index(col)] = col + '__sort_col'
+            elif isinstance(df_plots[col].dtype, pd.CategoricalDtype) and not df_plots[col].cat.categories.is_monotonic_increasing:
+                df_plots[col] = df_plots[col].astype(object)
         #Do sorting
         df_plots = df_plots.sort_values(temp_sort_cols).reset_index(drop=True)
+        df_plots = decode_categoricals(df_plots)
         # Remove leading zeros (sometime used for sorting integers)
         for col in temp_sort_cols:
             original_dtype = df_plots[col].dtype
@@ -871,15 +1288,109 @@ def set_df_plots(df_source, cols, wdg, custom_sorts={}):
             df_plots = df_plots.drop('y_cumulative', axis=1)
             sortby_cols.remove('y_cumulative')
 
+    df_plots = decode_categoricals(df_plots)
+
     #Rearrange column order for csv download
     sorted_cols = sortby_cols + [wdg['y'].value] + range_cols + net_level_col
     unsorted_columns = [col for col in df_plots.columns if col not in sorted_cols]
     df_plots = df_plots[unsorted_columns + sorted_cols]
-    logger.info('***Done Filtering, Scaling, Aggregating, Adv Operations, Sorting: '+ str(datetime.datetime.now() - startTime))
-    if wdg['render_plots'].value == 'No':
-        logger.info('***Ready for download!')
     return df_plots
 
+def decode_categoricals(df):
+    '''
+    Convert categorical columns (see get_categorical()) back to plain values. This is done by the last stage
+    of set_df_plots, so figures and downloads are built from plain values.
+    '''
+    cat_cols = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if cat_cols:
+        df = df.astype({col: object for col in cat_cols})
+    return df
+
+def boxplot_df(df_plots, wdg, cols, custom_sorts):
+    '''
+    Stage of set_df_plots: If boxplots are shown, compute their quantiles (see get_boxplot_stats) and keep them in
+    df_plots.attrs['boxplot'] for create_figures. The data itself is not changed.
+    '''
+    if wdg['range'].value == 'Boxplot':
+        df_plots = df_plots.copy(deep=False)
+        df_plots.attrs['boxplot'] = get_boxplot_stats(df_plots, wdg)
+    return df_plots
+
+#Functions for each stage of set_df_plots
+STAGE_FUNCS = {'filter': filter_df, 'limit': limit_series, 'aggregate': aggregate_df, 'adv_ops': adv_ops_df, 'scale': scale_df, 'sort': sort_df,
+    'boxplot': boxplot_df}
+
+def fill_missing(df_plots, df_source, cols, filters, fill_dims=None):
+    '''
+    Add rows of zeros to filtered data so that every combination of the values of fill_dims that pass the
+    filters has an entry. If fill_dims are all of cols['fill'], this has the rows of reindexing the full source on the
+    product of these columns and then filtering, but only materializes the filtered combinations. Otherwise, one row is
+    added for each missing combination of fill_dims, with the first filtered value of the other fill columns. Added rows
+    whose values of other columns (e.g. '{BLANK}', 0, or the value of a joined column) are excluded by the filters are
+    dropped. The rows of df_plots keep their order, and the added rows follow them in the order of the product.
+
+    Args:
+        df_plots (pandas dataframe): df_source after filtering.
+        df_source (pandas dataframe): Dataframe of the source.
+        cols (dict): Keys are categories of columns of df_source, and values are a list of columns of that category.
+            cols['fill'] are the columns to fill along. cols['fill_counts'] (optional) has fill columns as keys and dicts
+            of the number of raw values mapped to each value as values. cols['fill_keys'] (optional) has joined columns
+            as keys and the fill columns they were joined on as values.
+        filters (dict): Keys are columns with values filtered out and values are lists of active filter values.
+        fill_dims (list, optional): Fill columns to fill along, in the order of cols['fill']. Default is all of them.
+            See get_fill_dims().
+
+    Returns:
+        df_plots (pandas dataframe): df_plots followed by rows for missing combinations.
+    '''
+    fill_cols = cols['fill']
+    if fill_dims is None:
+        fill_dims = fill_cols
+    #Mapped columns have one row in the full product for each raw value that maps to each value
+    fill_counts = cols.get('fill_counts', {}) if len(fill_dims) == len(fill_cols) else {}
+    fill_levels = {}
+    for col in fill_cols:
+        level = pd.unique(df_source[col])
+        if col in filters:
+            level = level[pd.Series(level).isin(filters[col]).values]
+        if len(level) == 0:
+            return df_plots
+        fill_levels[col] = level
+    levels = [fill_levels[col] for col in fill_dims]
+    codes = np.zeros(len(df_plots), dtype=np.int64)
+    required = np.ones(1, dtype=np.int64)
+    for col, level in zip(fill_dims, levels):
+        codes = codes * len(level) + pd.Index(level).get_indexer(df_plots[col])
+        if col in fill_counts:
+            counts = pd.Series(level, dtype=object).map(fill_counts[col]).fillna(1).astype(np.int64).values
+        else:
+            counts = np.ones(len(level), dtype=np.int64)
+        required = np.multiply.outer(required, counts).ravel()
+    missing = required - np.bincount(codes, minlength=len(required))
+    missing = np.repeat(np.arange(len(required)), np.clip(missing, 0, None))
+    if len(missing) == 0:
+        return df_plots
+    level_idx = np.unravel_index(missing, [len(level) for level in levels])
+    df_missing = pd.DataFrame({col: level[idx] for col, level, idx in zip(fill_dims, levels, level_idx)})
+    for col in fill_cols:
+        if col not in fill_dims:
+            df_missing[col] = fill_levels[col][0]
+    keep = np.ones(len(df_missing), dtype=bool)
+    for col in df_plots.columns:
+        if col in fill_cols:
+            continue
+        if col in cols.get('fill_keys', {}):
+            key = cols['fill_keys'][col]
+            df_missing[col] = df_missing[key].astype(object).map(df_source.drop_duplicates(key).set_index(key)[col])
+        elif col in cols['continuous']:
+            df_missing[col] = 0
+        else:
+            df_missing[col] = '{BLANK}'
+        if col in filters:
+            uniques = get_filter_codes(df_source, col)[1]
+            keep &= ~(df_missing[col].isin(uniques) & ~df_missing[col].isin(filters[col])).values
+    return pd.concat([df_plots, df_missing.loc[keep, df_plots.columns]], ignore_index=True)
+
 def do_op(df_plots, wdg, cols, sfx):
     op = wdg['adv_op' + sfx].value
     col = wdg['adv_col' + sfx].value
@@ -889,20 +1400,19 @@ def do_op(df_plots, wdg, cols, sfx):
     if op != 'None' and col != 'None' and col in df_plots and col_base != 'None' and y_agg != 'None' and y_val in cols['continuous'] and wdg['range'].value == 'No':
         if col in cols['continuous'] and col_base not in ADV_BASES:
             col_base = float(col_base)
-        #groupby all columns that are not the operating column and y axis column so we can do operations on y-axis across the operating column
+        #group by all columns that are not the operating column and y axis column so we can do operations on y-axis across the operating column
         groupcols = [i for i in df_plots.columns.values.tolist() if i not in [col, y_val]]
         if groupcols != []:
-            df_grouped = df_plots.groupby(groupcols, sort=False)
+            groups = df_plots.groupby(groupcols, sort=False, observed=True).ngroup()
         else:
-            #if we don't have other columns to group, make one, to prevent error
-            df_plots['tempgroup'] = 1
-            df_grouped = df_plots.groupby('tempgroup', sort=False)
-        #Now do operations with the groups:
-        df_plots = df_grouped.apply(op_with_base, op, col, col_base, y_val).reset_index(drop=True)
+            #if we don't have other columns to group, all rows are in one group
+            groups = pd.Series(0, index=df_plots.index)
+        #rows with missing values in the group columns aren't in any group, so drop them
+        df_plots = df_plots[groups >= 0].reset_index(drop=True)
+        groups = groups[groups >= 0].reset_index(drop=True)
+        df_plots[y_val] = op_with_base(df_plots, groups, op, col, col_base, y_val)
         df_plots = df_plots.replace([np.inf, -np.inf], np.nan)
-        #Finally, clean up df_plots, dropping unnecessary columns, rows with the base value, and any rows with NAs for y_vals
-        if 'tempgroup' in df_plots:
-            df_plots.drop(['tempgroup'], axis='columns', inplace=True)
+        #Finally, clean up df_plots, dropping rows with the base value, and any rows with NAs for y_vals
         df_plots = df_plots[~df_plots[col].isin([col_base])]
         df_plots = df_plots[pd.notnull(df_plots[y_val])]
     return df_plots
@@ -924,19 +1434,23 @@ def create_figures(df_plots, wdg, cols, custom_colors):
     logger.info('***Building Figures...')
     plot_list = []
     df_plots_cp = df_plots.copy()
+    df_box = None
+    if wdg['range'].value == 'Boxplot':
+        #the quantiles are computed in the boxplot stage of set_df_plots
+        df_box = df_plots.attrs['boxplot'] if 'boxplot' in df_plots.attrs else get_boxplot_stats(df_plots, wdg)
     if wdg['explode'].value == 'None':
-        plot_list.append(create_figure(df_plots_cp, df_plots, wdg, cols, custom_colors))
+        plot_list.append(create_figure(df_plots_cp, df_plots, wdg, cols, custom_colors, df_box=df_box))
     else:
+        #Partition the data in one pass per level, keeping the order in which explode values first appear
+        explode_cols = [wdg['explode'].value] if wdg['explode_group'].value == 'None' else [wdg['explode_group'].value, wdg['explode'].value]
+        box_parts = {} if df_box is None else {key: df for key, df in df_box.groupby(explode_cols if len(explode_cols) > 1 else explode_cols[0])}
         if wdg['explode_group'].value == 'None':
-            for explode_val in df_plots_cp[wdg['explode'].value].unique().tolist():
-                df_exploded = df_plots_cp[df_plots_cp[wdg['explode'].value].isin([explode_val])].copy()
-                plot_list.append(create_figure(df_exploded, df_plots, wdg, cols, custom_colors, explode_val))
+            for explode_val, df_exploded in df_plots_cp.groupby(wdg['explode'].value, sort=False):
+                plot_list.append(create_figure(df_exploded.copy(), df_plots, wdg, cols, custom_colors, explode_val, df_box=box_parts.get(explode_val)))
         else:
-            for explode_group in df_plots_cp[wdg['explode_group'].value].unique().tolist():
-                df_exploded_group = df_plots_cp[df_plots_cp[wdg['explode_group'].value].isin([explode_group])]
-                for explode_val in df_exploded_group[wdg['explode'].value].unique().tolist():
-                    df_exploded = df_exploded_group[df_exploded_group[wdg['explode'].value].isin([explode_val])].copy()
-                    plot_list.append(create_figure(df_exploded, df_plots, wdg, cols, custom_colors, explode_val, explode_group))
+            for explode_group, df_exploded_group in df_plots_cp.groupby(wdg['explode_group'].value, sort=False):
+                for explode_val, df_exploded in df_exploded_group.groupby(wdg['explode'].value, sort=False):
+                    plot_list.append(create_figure(df_exploded.copy(), df_plots, wdg, cols, custom_colors, explode_val, explode_group, df_box=box_parts.get((explode_group, explode_val))))
     set_axis_bounds(df_plots, plot_list, wdg, cols)
     if wdg['explode_grid'].value == 'Yes':
         ncols = len(df_plots_cp[wdg['explode'].value].unique())
@@ -944,6 +1458,39 @@ def create_figures(df_plots, wdg, cols, custom_colors):
     logger.info('***Done Building Figures.')
     return plot_list
 
+def get_boxplot_stats(df_plots, wdg):
+    '''
+    Compute the boxplot quantiles of y for every point of the plots (x, x_group, series, explode, and explode_group)
+    in one grouped quantile computation.
+
+    Args:
+        df_plots (pandas dataframe): Dataframe of csv source after being filtered, scaled, aggregated, and sorted.
+        wdg (ordered dict): Dictionary of bokeh model widgets.
+
+    Returns:
+        df_box (pandas dataframe): The groupby columns, followed by the 5%, 25%, 50%, 75%, and 95% quantiles
+            (columns 'lo', 'q1', 'q2', 'q3', 'up'), and a 'quartile_legend' column of formatted quantiles.
+            Rows are sorted by the groupby columns.
+    '''
+    groupby_cols = get_groupby_cols(wdg)
+    df_box = df_plots.groupby(groupby_cols)[wdg['y'].value].quantile([0.05, 0.25, 0.5, 0.75, 0.95]).unstack()
+    df_box.columns = ['lo', 'q1', 'q2', 'q3', 'up']
+    df_box = df_box.reset_index()
+    fmt = '{:.2e}'.format
+    df_box['quartile_legend'] = ('5%: ' + df_box['lo'].map(fmt) + ', 25%: ' + df_box['q1'].map(fmt) + ', 50%: ' +
+        df_box['q2'].map(fmt) + ', 75%: ' + df_box['q3'].map(fmt) + ', 95%: ' + df_box['up'].map(fmt))
+    return df_box
+
+def get_level_boxplot(x_col, xs, ys):
+    '''
+    Return boxplot rows like those of get_boxplot_stats() for a single y value at each x, e.g. the stacked levels
+    of a series, so all quantiles are that value.
+    '''
+    df_box = pd.DataFrame({x_col: xs, 'lo': ys, 'q1': ys, 'q2': ys, 'q3': ys, 'up': ys})
+    legend = df_box['q2'].map('{:.2e}'.format)
+    df_box['quartile_legend'] = '5%: ' + legend + ', 25%: ' + legend + ', 50%: ' + legend + ', 75%: ' + legend + ', 95%: ' + legend
+    return df_box
+
 def set_axis_bounds(df, plots, wdg, cols):
     '''
     Set minimums and maximums for x and y axes.
@@ -1034,7 +1581,7 @@ def set_axis_bounds(df, plots, wdg, cols):
                 p.y_range.end = max_y
 
 
-def create_figure(df_exploded, df_plots, wdg, cols, custom_colors, explode_val=None, explode_group=None):
+def create_figure(df_exploded, df_plots, wdg, cols, custom_colors, explode_val=None, explode_group=None, df_box=None):
     '''
     Create and return a figure based on the data in a dataframe and widget configuration.
 
@@ -1046,6 +1593,7 @@ def create_figure(df_exploded, df_plots, wdg, cols, custom_colors, explode_val=N
         custom_colors (dict): Keys are column names and values are dicts that map column values to colors (hex strings)
         explode_val (string, optional): The value in the column designated by wdg['explode'] that applies to this figure.
         explode_group (string, optional): The value in the wdg['explode_group'] column that applies to this figure.
+        df_box (pandas dataframe, optional): Rows of get_boxplot_stats() for this figure, if boxplots are shown.
 
     Returns:
         p (bokeh.model.figure): A figure, with all glyphs added by the add_glyph() function.
@@ -1055,13 +1603,17 @@ def create_figure(df_exploded, df_plots, wdg, cols, custom_colors, explode_val=N
     if wdg['x_group'].value != 'None':
         x_col = str(wdg['x_group'].value) + '_' + str(wdg['x'].value)
         df_exploded[x_col] = df_exploded[wdg['x_group'].value].map(str) + ' ' + df_exploded[wdg['x'].value].map(str)
+        if df_box is not None:
+            df_box = df_box.copy()
+            df_box[x_col] = df_box[wdg['x_group'].value].map(str) + ' ' + df_box[wdg['x'].value].map(str)
+            df_box = df_box.sort_values(x_col, kind='mergesort')
 
     #Build x and y ranges and figure title
     kw = dict()
     chart_type = wdg['chart_type'].value
     #Set x and y ranges. When x is grouped, there is added complication of separating the groups
-    xs = df_exploded[x_col].values.tolist()
-    ys = df_exploded[wdg['y'].value].values.tolist()
+    xs = df_exploded[x_col].values
+    ys = df_exploded[wdg['y'].value].values
     if not (chart_type == 'Bar' and wdg['bar_width'].value == 'c'):
         if wdg['x_group'].value != 'None':
             kw['x_range'] = []
@@ -1074,15 +1626,9 @@ def create_figure(df_exploded, df_plots, wdg, cols, custom_colors, explode_val=N
                 #one break to the next so that each entry is unique
                 kw['x_range'].append(' ' * (i + 1))
         elif wdg['x'].value in cols['discrete']:
-            kw['x_range'] = []
-            for x in xs:
-                if x not in kw['x_range']:
-                    kw['x_range'].append(x)
+            kw['x_range'] = pd.unique(xs).tolist()
         if wdg['y'].value in cols['discrete']:
-            kw['y_range'] = []
-            for y in ys:
-                if y not in kw['y_range']:
-                    kw['y_range'].append(y)
+            kw['y_range'] = pd.unique(ys).tolist()
 
     #Set figure title
     kw['title'] = wdg['plot_title'].value
@@ -1123,59 +1669,137 @@ def create_figure(df_exploded, df_plots, wdg, cols, custom_colors, explode_val=N
         p.toolbar.logo = None
         p.toolbar_location = None
 
-    #Add glyphs to figure
+    #Add glyphs to figure. Glyphs of the same kind share sources, which are filled once all glyphs are added.
+    sources = init_glyph_sources()
     c = C_NORM
     if wdg['series'].value == 'None':
         if wdg['range'].value == 'Within Series':
-            y_mins = df_exploded['range_min'].values.tolist()
-            y_maxs = df_exploded['range_max'].values.tolist()
-            add_glyph(RANGE_GLYPH_MAP[chart_type], wdg, p, xs, y_maxs, c, y_bases=y_mins, opacity_mult=RANGE_OPACITY_MULT)
+            y_mins = df_exploded['range_min'].values
+            y_maxs = df_exploded['range_max'].values
+            add_glyph(RANGE_GLYPH_MAP[chart_type], wdg, p, sources, xs, y_maxs, c, y_bases=y_mins, opacity_mult=RANGE_OPACITY_MULT)
         if wdg['range_show_glyphs'].value == 'Yes':
-            add_glyph(chart_type, wdg, p, xs, ys, c)
+            add_glyph(chart_type, wdg, p, sources, xs, ys, c)
+            if df_box is not None:
+                add_boxplot(wdg, p, sources, df_box, x_col, c)
     else:
-        full_series = df_plots[wdg['series'].value].unique().tolist() #for colors only
-        xs_full = df_exploded[x_col].unique().tolist()
+        #Colors are custom colors if they exist, or otherwise by order of the series across all plots
+        full_series = df_plots[wdg['series'].value].unique().tolist()
+        ser_custom_colors = custom_colors[wdg['series'].value] if custom_colors and wdg['series'].value in custom_colors else {}
+        ser_colors = {ser: ser_custom_colors[ser] if ser in ser_custom_colors else COLORS[i] for i, ser in enumerate(full_series)}
+        xs_full = df_exploded[x_col].unique()
+        #Split into series with one stable sort, so each series is a slice of the sorted arrays
+        ser_list = df_exploded[wdg['series'].value].unique().tolist()
+        box_parts = {} if df_box is None else {ser: df for ser, df in df_box.groupby(wdg['series'].value, sort=False)}
+        ser_codes = pd.Index(ser_list).get_indexer(df_exploded[wdg['series'].value])
+        ser_order = np.argsort(ser_codes, kind='stable')
+        ser_bounds = np.searchsorted(ser_codes[ser_order], np.arange(len(ser_list) + 1))
+        xs_sorted = df_exploded[x_col].values[ser_order]
+        ys_sorted = df_exploded[wdg['y'].value].values[ser_order]
+        if wdg['range'].value == 'Within Series':
+            y_mins_sorted = df_exploded['range_min'].values[ser_order]
+            y_maxs_sorted = df_exploded['range_max'].values[ser_order]
         if chart_type in STACKEDTYPES: #We are stacking the series
-            y_bases_pos = [0]*len(xs_full)
-            y_bases_neg = [0]*len(xs_full)
+            #Pivot into a (series x x) matrix of y values, using the first y value of each series at each x,
+            #and stack positive and negative values separately with cumulative sums across series.
+            df_stack = df_exploded.drop_duplicates([wdg['series'].value, x_col])
+            ys_matrix = np.zeros((len(ser_list), len(xs_full)))
+            ys_matrix[pd.Index(ser_list).get_indexer(df_stack[wdg['series'].value]), pd.Index(xs_full).get_indexer(df_stack[x_col])] = df_stack[wdg['y'].value].values
+            ys_pos = np.where(ys_matrix > 0, ys_matrix, 0)
+            ys_neg = np.where(ys_matrix < 0, ys_matrix, 0)
+            ys_stacked_pos = np.cumsum(ys_pos, axis=0)
+            ys_stacked_neg = np.cumsum(ys_neg, axis=0)
+            y_bases_pos = np.vstack([np.zeros((1, len(xs_full))), ys_stacked_pos[:-1]])
+            y_bases_neg = np.vstack([np.zeros((1, len(xs_full))), ys_stacked_neg[:-1]])
         elif wdg['range'].value == 'Between Series':
-            y_mins = []
-            y_maxs = []
-            for x_unique in xs_full:
-                y_group = [ys[i] for i, x in enumerate(xs) if x == x_unique]
-                y_mins.append(min(y_group))
-                y_maxs.append(max(y_group))
-            add_glyph(RANGE_GLYPH_MAP[chart_type], wdg, p, xs_full, y_maxs, c, y_bases=y_mins, opacity_mult=RANGE_OPACITY_MULT)
-        for i, ser in enumerate(df_exploded[wdg['series'].value].unique().tolist()):
-            if custom_colors and wdg['series'].value in custom_colors and ser in custom_colors[wdg['series'].value]:
-                c = custom_colors[wdg['series'].value][ser]
-            else:
-                c = COLORS[full_series.index(ser)]
-            df_series = df_exploded[df_exploded[wdg['series'].value].isin([ser])]
-            xs_ser = df_series[x_col].values.tolist()
-            ys_ser = df_series[wdg['y'].value].values.tolist()
+            y_ranges = df_exploded.groupby(x_col, sort=False)[wdg['y'].value].agg(['min', 'max'])
+            y_mins = y_ranges['min'].values
+            y_maxs = y_ranges['max'].values
+            add_glyph(RANGE_GLYPH_MAP[chart_type], wdg, p, sources, xs_full, y_maxs, c, y_bases=y_mins, opacity_mult=RANGE_OPACITY_MULT)
+        for i, ser in enumerate(ser_list):
+            c = ser_colors[ser]
+            ser_slice = slice(ser_bounds[i], ser_bounds[i + 1])
+            xs_ser = xs_sorted[ser_slice]
+            ys_ser = ys_sorted[ser_slice]
             if chart_type not in STACKEDTYPES: #The series will not be stacked
                 if wdg['range'].value == 'Within Series':
-                    y_mins_ser = df_series['range_min'].values.tolist()
-                    y_maxs_ser = df_series['range_max'].values.tolist()
-                    add_glyph(RANGE_GLYPH_MAP[chart_type], wdg, p, xs_ser, y_maxs_ser, c, y_bases=y_mins_ser, series=ser, opacity_mult=RANGE_OPACITY_MULT)
+                    y_mins_ser = y_mins_sorted[ser_slice]
+                    y_maxs_ser = y_maxs_sorted[ser_slice]
+                    add_glyph(RANGE_GLYPH_MAP[chart_type], wdg, p, sources, xs_ser, y_maxs_ser, c, y_bases=y_mins_ser, series=ser, opacity_mult=RANGE_OPACITY_MULT)
                 if wdg['range_show_glyphs'].value == 'Yes':
-                    add_glyph(chart_type, wdg, p, xs_ser, ys_ser, c, series=ser)
+                    add_glyph(chart_type, wdg, p, sources, xs_ser, ys_ser, c, series=ser)
+                    if ser in box_parts:
+                        add_boxplot(wdg, p, sources, box_parts[ser], x_col, c, series=ser)
             else: #We are stacking the series
-                ys_pos = [ys_ser[xs_ser.index(x)] if x in xs_ser and ys_ser[xs_ser.index(x)] > 0 else 0 for i, x in enumerate(xs_full)]
-                ys_neg = [ys_ser[xs_ser.index(x)] if x in xs_ser and ys_ser[xs_ser.index(x)] < 0 else 0 for i, x in enumerate(xs_full)]
-                ys_stacked_pos = [ys_pos[i] + y_bases_pos[i] for i in range(len(xs_full))]
-                ys_stacked_neg = [ys_neg[i] + y_bases_neg[i] for i in range(len(xs_full))]
-                add_glyph(chart_type, wdg, p, xs_full, ys_stacked_pos, c, y_bases=y_bases_pos, series=ser)
-                add_glyph(chart_type, wdg, p, xs_full, ys_stacked_neg, c, y_bases=y_bases_neg, series=ser)
-                y_bases_pos = ys_stacked_pos
-                y_bases_neg = ys_stacked_neg
-        if wdg['net_levels'].value == 'Yes' and chart_type in STACKEDTYPES:
-            ys_net = [ys_stacked_pos[i] + ys_stacked_neg[i] for i,x in enumerate(xs_full)]
-            add_glyph('Dot', wdg, p, xs_full, ys_net, 'black', series='Net Level')
+                add_glyph(chart_type, wdg, p, sources, xs_full, ys_stacked_pos[i], c, y_bases=y_bases_pos[i], series=ser)
+                add_glyph(chart_type, wdg, p, sources, xs_full, ys_stacked_neg[i], c, y_bases=y_bases_neg[i], series=ser)
+                if df_box is not None:
+                    #boxplots of stacked series are drawn at their stacked levels
+                    add_boxplot(wdg, p, sources, get_level_boxplot(x_col, xs_full, ys_stacked_pos[i]), x_col, c, series=ser)
+                    add_boxplot(wdg, p, sources, get_level_boxplot(x_col, xs_full, ys_stacked_neg[i]), x_col, c, series=ser)
+        if wdg['net_levels'].value == 'Yes' and chart_type in STACKEDTYPES and len(ser_list) > 0:
+            ys_net = ys_stacked_pos[-1] + ys_stacked_neg[-1]
+            add_glyph('Dot', wdg, p, sources, xs_full, ys_net, 'black', series='Net Level')
+            if df_box is not None:
+                add_boxplot(wdg, p, sources, get_level_boxplot(x_col, xs_full, ys_net), x_col, 'black', series='Net Level')
+    fill_glyph_sources(sources)
     return p
 
-def add_glyph(glyph_type, wdg, p, xs, ys, c, y_bases=None, series=None, opacity_mult=1):
+def init_glyph_sources():
+    '''
+    Return an empty dict for the shared sources of a figure. See add_glyph_data().
+    '''
+    return collections.OrderedDict()
+
+def add_glyph_data(sources, kind, series, data):
+    '''
+    Add the data of a glyph of one series to a source that is shared by the glyphs of this kind in the figure, and
+    return the source with a view of just the series. Each shared source has at most one glyph per series, so a
+    second glyph of the same kind and series (e.g. the negative half of a stacked bar) goes to the next source.
+    Lines have connected topology, which bokeh doesn't allow to be filtered, so they are not added to shared sources.
+
+    Args:
+        sources (dict): Shared sources of the figure, from init_glyph_sources().
+        kind (str): Kind of glyph, where glyphs of the same kind have the same columns.
+        series (str): Name of the series, which must match the 'ser_legend' column of data.
+        data (dict): Keys are column names and values are arrays (or lists for patches) of equal length.
+
+    Returns:
+        source (bokeh.models.ColumnDataSource): The shared source.
+        view (bokeh.models.CDSView): View of just the rows of this series in the shared source.
+    '''
+    i = 0
+    while (kind, i) in sources and series in sources[(kind, i)]['series']:
+        i += 1
+    if (kind, i) not in sources:
+        sources[(kind, i)] = {'source': bms.ColumnDataSource(), 'series': [], 'parts': [], 'views': []}
+    src = sources[(kind, i)]
+    view = bm.CDSView(source=src['source'], filters=[bm.GroupFilter(column_name='ser_legend', group=series)])
+    src['series'].append(series)
+    src['parts'].append(data)
+    src['views'].append(view)
+    return src['source'], view
+
+def fill_glyph_sources(sources):
+    '''
+    Set the data of the shared sources to the concatenation of the data added by add_glyph_data(). Views of sources
+    with a single series don't need their filter, so it is removed.
+
+    Args:
+        sources (dict): Shared sources of the figure, from init_glyph_sources().
+
+    Returns:
+        Nothing: The sources and views are modified.
+    '''
+    for src in sources.values():
+        data = {}
+        for col in src['parts'][0]:
+            vals = [part[col] for part in src['parts']]
+            data[col] = [v for val in vals for v in val] if isinstance(vals[0], list) else np.concatenate(vals)
+        src['source'].data = data
+        if len(src['series']) == 1:
+            src['views'][0].filters = []
+
+def add_glyph(glyph_type, wdg, p, sources, xs, ys, c, y_bases=None, series=None, opacity_mult=1):
     '''
     Add a glyph to a Bokeh figure, depending on the chosen chart type.
 
@@ -1183,98 +1807,305 @@ def add_glyph(glyph_type, wdg, p, xs, ys, c, y_bases=None, series=None, opacity_
         glyph_type (str): Type of glyph (e.g. 'Dot', 'Line', 'Bar', 'Area')
         wdg (ordered dict): Dictionary of bokeh model widgets.
         p (bokeh.model.figure): Bokeh figure.
-        xs (list): List of x-values. These could be numeric or strings.
-        ys (list): List of y-values. These could be numeric or strings. If series data is stacked, these values include stacking.
+        sources (dict): Shared sources of the figure, from init_glyph_sources(). fill_glyph_sources() must be called after the last glyph is added.
+        xs (array-like): Array of x-values. These could be numeric or strings.
+        ys (array-like): Array of y-values. These could be numeric or strings. If series data is stacked, these values include stacking.
         c (string): Color to use for this series.
-        y_bases (list, optional): Only used when stacking series. This is the previous cumulative stacking level.
+        y_bases (array-like, optional): Only used when stacking series. This is the previous cumulative stacking level.
         series (string): Name of current series for this glyph.
 
     Returns:
         Nothing.
     '''
     alpha = float(wdg['opacity'].value)*opacity_mult
-    y_unstacked = list(ys) if y_bases is None else [ys[i] - y_bases[i] for i in range(len(ys))]
-    ser = ['None']*len(xs) if series is None else [series]*len(xs)
+    #Glyph data is kept in numpy arrays, which bokeh serializes as binary buffers rather than lists
+    xs = np.asarray(xs)
+    ys = np.asarray(ys)
+    if y_bases is not None: y_bases = np.asarray(y_bases)
+    y_unstacked = ys if y_bases is None else ys - y_bases
+    #Series names are strings so that the views of shared sources can select them
+    ser_name = 'None' if series is None else str(series)
+    ser = np.full(len(xs), ser_name, dtype=object)
     if glyph_type in ['Dot', 'Dot-Line']:
-        source = bms.ColumnDataSource({'x': xs, 'y': ys, 'x_legend': xs, 'y_legend': y_unstacked, 'ser_legend': ser})
-        p.circle('x', 'y', source=source, color=c, size=int(wdg['circle_size'].value), fill_alpha=alpha, line_color=None, line_width=0)
+        source, view = add_glyph_data(sources, 'circle', ser_name, {'x': xs, 'y': ys, 'x_legend': xs, 'y_legend': y_unstacked, 'ser_legend': ser})
+        p.circle('x', 'y', source=source, view=view, color=c, size=int(wdg['circle_size'].value), fill_alpha=alpha, line_color=None, line_width=0)
     if glyph_type in ['Line', 'Dot-Line']:
         source = bms.ColumnDataSource({'x': xs, 'y': ys, 'x_legend': xs, 'y_legend': y_unstacked, 'ser_legend': ser})
         p.line('x', 'y', source=source, color=c, alpha=alpha, line_width=float(wdg['line_width'].value))
-    if glyph_type == 'Bar' and y_unstacked != [0]*len(y_unstacked):
-        if y_bases is None: y_bases = [0]*len(ys)
-        centers = [(ys[i] + y_bases[i])/2 for i in range(len(ys))]
-        heights = [abs(ys[i] - y_bases[i]) for i in range(len(ys))]
-        xs_cp = list(xs) #we don't want to modify xs that are passed into function
-        x_legend = list(xs)
+    if glyph_type == 'Bar' and np.any(y_unstacked != 0):
+        if y_bases is None: y_bases = np.zeros(len(ys))
+        centers = (ys + y_bases)/2
+        heights = np.abs(ys - y_bases)
+        xs_bar = xs
+        x_legend = xs
         if wdg['x'].value == 'histogram_x':
             width = xs[1] - xs[0]
-            x_legend = [str(x_legend[i] - width/2) + ' to ' + str(x_legend[i] + width/2) for i, x in enumerate(xs)]
-            widths = [width]*len(xs)
+            x_legend = np.array([str(x - width/2) + ' to ' + str(x + width/2) for x in xs.tolist()], dtype=object)
+            widths = np.full(len(xs), width)
         elif wdg['bar_width'].value == 'w': #this means we are looking for the mapping in the _bar_width file
-            df_bar_width = pd.read_csv(this_dir_path + '/in/' + wdg['x'].value + '_bar_width.csv', index_col='display')
-            max_width = df_bar_width['width'].max()
-            widths = [df_bar_width.loc[x, 'width']/max_width for x in xs]
-            x_legend = [str(x_legend[i]) + ' (width = ' + str(df_bar_width.loc[x, 'width']) + ')' for i, x in enumerate(xs)]
+            bar_widths = get_bar_widths(wdg['x'].value)
+            widths_raw = bar_widths.loc[xs].values
+            widths = widths_raw/bar_widths.max()
+            x_legend = np.array([str(x) + ' (width = ' + str(w) + ')' for x, w in zip(xs.tolist(), widths_raw.tolist())], dtype=object)
         elif wdg['bar_width'].value == 'c': #this means we are converting x axis to continuous and have no gaps between bars
-            widths = []
-            df_bar_width = pd.read_csv(this_dir_path + '/in/' + wdg['x'].value + '_bar_width.csv', index_col='display')
-            xs_cum = 0
-            for i, xo in enumerate(xs):
-                width = df_bar_width.loc[xo, 'width']
-                widths.append(width)
-                xs_cp[i] = width/2 + xs_cum
-                xs_cum = xs_cum + width
-                x_legend[i] = str(x_legend[i]) + ' (width = ' + str(width) + ', ' + str(xs_cum) + ' cumulative)'
+            widths = get_bar_widths(wdg['x'].value).loc[xs].values
+            xs_cum = np.cumsum(widths)
+            xs_bar = widths/2 + np.concatenate([[0], xs_cum[:-1]])
+            x_legend = np.array([str(x) + ' (width = ' + str(w) + ', ' + str(cum) + ' cumulative)' for x, w, cum in zip(xs.tolist(), widths.tolist(), xs_cum.tolist())], dtype=object)
         else:
-            widths = [float(wdg['bar_width'].value)]*len(xs)
-        #bars have issues when height is 0, so remove elements whose height is 0 
-        heights_orig = list(heights) #we make a copy so we aren't modifying the list we are iterating on.
-        for i, h in reversed(list(enumerate(heights_orig))):
-            #Ok this is getting absurd, but rects with near-zero heights also break the glyphs.
-            #See https://github.com/bokeh/bokeh/issues/6583.
-            if abs(h) <= 1e-13:
-                del xs_cp[i], centers[i], heights[i], y_unstacked[i], ser[i], widths[i], x_legend[i]
-        source = bms.ColumnDataSource({'x': xs_cp, 'y': centers, 'x_legend': x_legend, 'y_legend': y_unstacked, 'h': heights, 'w': widths, 'ser_legend': ser})
-        p.rect('x', 'y', source=source, height='h', color=c, fill_alpha=alpha, width='w', line_color=None, line_width=0)
-    if glyph_type =='Area' and y_unstacked != [0]*len(y_unstacked):
-        if y_bases is None: y_bases = [0]*len(ys)
-        xs_around = xs + xs[::-1]
-        ys_around = y_bases + ys[::-1]
-        source = bms.ColumnDataSource({'x': [xs_around], 'y': [ys_around], 'x_legend': [wdg['x'].value], 'y_legend': [wdg['y'].value], 'ser_legend': [series]})
-        p.patches('x', 'y', source=source, alpha=alpha, fill_color=c, line_color=None, line_width=0)
-
-    #Add boxplots
-    if wdg['range'].value == 'Boxplot':
-        df = pd.DataFrame({'x':xs,'y':ys})
-        groups = df.groupby('x')
-        q1 = groups.quantile(q=0.25)
-        q2 = groups.quantile(q=0.5)
-        q3 = groups.quantile(q=0.75)
-        iqr = q3 - q1
-        up = groups.quantile(q=0.95)
-        lo = groups.quantile(q=0.05)
-        box_centers = (q1 + q3)/2
-        x_range = q2.index.tolist()
-        quartile_legend = ['5%: ' + '{:.2e}'.format(lo['y'][r]) + ', 25%: ' + '{:.2e}'.format(q1['y'][r]) + ', 50%: ' + '{:.2e}'.format(q2['y'][r]) + ', 75%: ' + '{:.2e}'.format(q3['y'][r]) + ', 95%: ' + '{:.2e}'.format(up['y'][r]) for r in x_range]
-        lw = float(wdg['line_width'].value)
-        width = float(wdg['bar_width'].value)
-        ser_box = ['None']*len(x_range) if series is None else [series]*len(x_range)
-        #boxes
-        src_q2 = bms.ColumnDataSource({'x': x_range, 'y': q2['y'].tolist(), 'x_legend': x_range, 'y_legend': q2['y'].tolist(), 'ser_legend': ser_box})
-        p.rect('x', 'y', source=src_q2, height=lw, width=width, color=c, fill_alpha=alpha, line_color=None, line_width=0, height_units="screen")
-        src_box = bms.ColumnDataSource({'x': x_range, 'y': box_centers['y'].tolist(), 'h': iqr['y'].tolist(), 'x_legend': x_range, 'y_legend': quartile_legend, 'ser_legend': ser_box})
-        p.rect('x', 'y', source=src_box, height='h', width=width, color=None, line_alpha=alpha, line_color=c, line_width=lw)
-        #whiskers
-        src_lo = bms.ColumnDataSource({'x': x_range, 'y': lo['y'].tolist(), 'x_legend': x_range, 'y_legend': lo['y'].tolist(), 'ser_legend': ser_box})
-        p.rect('x', 'y', source=src_lo, height=lw, width=0.9*width, color=c, fill_alpha=alpha, line_color=None, line_width=0, height_units="screen")
-        src_up = bms.ColumnDataSource({'x': x_range, 'y': up['y'].tolist(), 'x_legend': x_range, 'y_legend': up['y'].tolist(), 'ser_legend': ser_box})
-        p.rect('x', 'y', source=src_up, height=lw, width=0.9*width, color=c, fill_alpha=alpha, line_color=None, line_width=0, height_units="screen")
-        #stems
-        src_upstem = bms.ColumnDataSource({'x0': x_range, 'y0': up['y'].tolist(), 'x1': x_range, 'y1': q3['y'].tolist(), 'x_legend': x_range, 'y_legend': quartile_legend, 'ser_legend': ser_box})
-        src_lostem = bms.ColumnDataSource({'x0': x_range, 'y0': lo['y'].tolist(), 'x1': x_range, 'y1': q1['y'].tolist(), 'x_legend': x_range, 'y_legend': quartile_legend, 'ser_legend': ser_box})
-        p.segment('x0', 'y0', 'x1', 'y1', source=src_upstem, line_color=c, line_width=lw/2, line_alpha=alpha)
-        p.segment('x0', 'y0', 'x1', 'y1', source=src_lostem, line_color=c, line_width=lw/2, line_alpha=alpha)
+            widths = np.full(len(xs), float(wdg['bar_width'].value))
+        #bars have issues when height is 0, so remove elements whose height is 0.
+        #Rects with near-zero heights also break the glyphs. See https://github.com/bokeh/bokeh/issues/6583.
+        keep = np.abs(heights) > 1e-13
+        source, view = add_glyph_data(sources, 'rect', ser_name, {'x': xs_bar[keep], 'y': centers[keep], 'x_legend': x_legend[keep], 'y_legend': y_unstacked[keep], 'h': heights[keep], 'w': widths[keep], 'ser_legend': ser[keep]})
+        p.rect('x', 'y', source=source, view=view, height='h', color=c, fill_alpha=alpha, width='w', line_color=None, line_width=0)
+    if glyph_type =='Area' and np.any(y_unstacked != 0):
+        if y_bases is None: y_bases = np.zeros(len(ys))
+        xs_around = np.concatenate([xs, xs[::-1]])
+        ys_around = np.concatenate([y_bases, ys[::-1]])
+        source, view = add_glyph_data(sources, 'patch', ser_name, {'x': [xs_around], 'y': [ys_around], 'x_legend': [wdg['x'].value], 'y_legend': [wdg['y'].value], 'ser_legend': [ser_name]})
+        p.patches('x', 'y', source=source, view=view, alpha=alpha, fill_color=c, line_color=None, line_width=0)
+
+def add_boxplot(wdg, p, sources, df_box, x_col, c, series=None):
+    '''
+    Add the glyphs of a boxplot to a Bokeh figure: median, box, whiskers and stems.
+
+    Args:
+        wdg (ordered dict): Dictionary of bokeh model widgets.
+        p (bokeh.model.figure): Bokeh figure.
+        sources (dict): Shared sources of the figure, from init_glyph_sources().
+        df_box (pandas dataframe): Rows of get_boxplot_stats() for this series and figure.
+        x_col (string): Column of df_box with the x-values.
+        c (string): Color to use for this series.
+        series (string): Name of current series for this boxplot.
+
+    Returns:
+        Nothing.
+    '''
+    alpha = float(wdg['opacity'].value)
+    lw = float(wdg['line_width'].value)
+    width = float(wdg['bar_width'].value)
+    ser_name = 'None' if series is None else str(series)
+    x_range = df_box[x_col].values
+    #All parts of the boxplot of this series are drawn from the same rows
+    source, view = add_glyph_data(sources, 'box', ser_name, {'x': x_range, 'x_legend': x_range, 'y_legend': df_box['quartile_legend'].values,
+        'ser_legend': np.full(len(x_range), ser_name, dtype=object), 'lo': df_box['lo'].values, 'q1': df_box['q1'].values, 'q2': df_box['q2'].values,
+        'q3': df_box['q3'].values, 'up': df_box['up'].values, 'box_center': ((df_box['q1'] + df_box['q3'])/2).values, 'iqr': (df_box['q3'] - df_box['q1']).values})
+    #boxes
+    p.rect('x', 'q2', source=source, view=view, height=lw, width=width, color=c, fill_alpha=alpha, line_color=None, line_width=0, height_units="screen")
+    p.rect('x', 'box_center', source=source, view=view, height='iqr', width=width, color=None, line_alpha=alpha, line_color=c, line_width=lw)
+    #whiskers
+    p.rect('x', 'lo', source=source, view=view, height=lw, width=0.9*width, color=c, fill_alpha=alpha, line_color=None, line_width=0, height_units="screen")
+    p.rect('x', 'up', source=source, view=view, height=lw, width=0.9*width, color=c, fill_alpha=alpha, line_color=None, line_width=0, height_units="screen")
+    #stems
+    p.segment('x', 'up', 'x', 'q3', source=source, view=view, line_color=c, line_width=lw/2, line_alpha=alpha)
+    p.segment('x', 'lo', 'x', 'q1', source=source, view=view, line_color=c, line_width=lw/2, line_alpha=alpha)
+
+def get_bar_widths(x):
+    '''
+    Return the bar widths of the values of column x, from the _bar_width file for x in the 'in' folder. The table is
+    read once and kept in GL['bar_width_tables'], and is only read again if the file has been modified since.
+
+    Args:
+        x (string): Name of the x column.
+
+    Returns:
+        bar_widths (pandas series): Widths, indexed by the 'display' values of x.
+    '''
+    filepath = this_dir_path + '/in/' + x + '_bar_width.csv'
+    mtime = os.stat(filepath).st_mtime_ns
+    if filepath not in GL['bar_width_tables'] or GL['bar_width_tables'][filepath][0] != mtime:
+        GL['bar_width_tables'][filepath] = (mtime, pd.read_csv(filepath, index_col='display')['width'])
+    return GL['bar_width_tables'][filepath][1]
+
+def patch_figures(figs, wdg, old_styles):
+    '''
+    Apply changes of STYLE_WDG widgets to the figures from create_figures(), by setting properties of the existing
+    figure and glyph models. This way only the changed properties are sent to the browser.
+
+    Args:
+        figs (list): List of bokeh.model.figures (or gridplot of figures) from create_figures().
+        wdg (ordered dict): Dictionary of bokeh model widgets.
+        old_styles (dict): Keys are STYLE_WDG widgets, and values are the values they had for the last build or patch of figs.
+
+    Returns:
+        Nothing: figs are modified.
+    '''
+    logger.info('***Patching Figures...')
+    lw = float(wdg['line_width'].value)
+    #Alphas are the opacity times a multiplier that depends on the glyph, so scale them
+    alpha_ratio = float(wdg['opacity'].value)/float(old_styles['opacity'])
+    for f in figs:
+        for p in f.select({'type': bm.Plot}):
+            #Figure titles are the plot title followed by the explode values
+            if wdg['plot_title'].value != old_styles['plot_title']:
+                if old_styles['plot_title'] == '':
+                    suffix = '' if p.title.text == '' else ', ' + p.title.text
+                else:
+                    suffix = p.title.text[len(old_styles['plot_title']):]
+                p.title.text = wdg['plot_title'].value + suffix if wdg['plot_title'].value != '' else suffix[2:]
+            p.plot_height = int(wdg['plot_height'].value)
+            p.plot_width = int(wdg['plot_width'].value)
+            p.title.text_font_size = wdg['plot_title_size'].value + 'pt'
+            p.xaxis.axis_label = wdg['x_title'].value
+            p.yaxis.axis_label = wdg['y_title'].value
+            p.xaxis.axis_label_text_font_size = wdg['x_title_size'].value + 'pt'
+            p.yaxis.axis_label_text_font_size = wdg['y_title_size'].value + 'pt'
+            p.xaxis.major_label_text_font_size = wdg['x_major_label_size'].value + 'pt'
+            p.yaxis.major_label_text_font_size = wdg['y_major_label_size'].value + 'pt'
+            p.xaxis.major_label_orientation = 'horizontal' if wdg['x_major_label_orientation'].value == '0' else math.radians(float(wdg['x_major_label_orientation'].value))
+            if wdg['bokeh_tools'].value != old_styles['bokeh_tools']:
+                p.toolbar.logo = None if wdg['bokeh_tools'].value == 'No' else 'normal'
+                p.toolbar_location = None if wdg['bokeh_tools'].value == 'No' else 'right'
+            for r in p.renderers:
+                g = r.glyph
+                #Sizes are also copied to the selection, nonselection, hover and muted glyphs
+                glyphs = [r.glyph, r.selection_glyph, r.nonselection_glyph, r.hover_glyph, r.muted_glyph]
+                glyphs = [gl for gl in glyphs if isinstance(gl, bm.Glyph)]
+                if isinstance(g, bm.Circle):
+                    g.fill_alpha = g.fill_alpha*alpha_ratio
+                    for gl in glyphs: gl.size = int(wdg['circle_size'].value)
+                elif isinstance(g, bm.Line):
+                    g.line_alpha = g.line_alpha*alpha_ratio
+                    for gl in glyphs: gl.line_width = lw
+                elif isinstance(g, bm.Segment):
+                    g.line_alpha = g.line_alpha*alpha_ratio
+                    for gl in glyphs: gl.line_width = lw/2
+                elif isinstance(g, bm.Rect) and g.height_units == 'screen':
+                    #boxplot median and whiskers
+                    g.fill_alpha = g.fill_alpha*alpha_ratio
+                    for gl in glyphs: gl.height = lw
+                elif isinstance(g, bm.Rect) and g.line_color is not None:
+                    #boxplot boxes
+                    g.line_alpha = g.line_alpha*alpha_ratio
+                    for gl in glyphs: gl.line_width = lw
+                elif isinstance(g, bm.Rect):
+                    g.fill_alpha = g.fill_alpha*alpha_ratio
+                elif isinstance(g, bm.Patches):
+                    g.fill_alpha = g.fill_alpha*alpha_ratio
+                    g.line_alpha = g.line_alpha*alpha_ratio
+                    g.hatch_alpha = g.hatch_alpha*alpha_ratio
+    logger.info('***Done Patching Figures.')
+
+def get_layout_plots(figs):
+    '''
+    Return the plots in a list of figures and gridplots from create_figures(), in order.
+    '''
+    plots = []
+    for f in figs:
+        if isinstance(f, bm.Plot):
+            plots.append(f)
+        else:
+            for grid in f.select({'type': bm.GridBox}):
+                plots += [child[0] for child in grid.children]
+    return plots
+
+def get_plot_structure(figs):
+    '''
+    Return the types and grid positions of the plots, ranges, axes, and glyphs in figs, for comparing figure structure.
+    '''
+    structure = []
+    for f in figs:
+        structure.append(type(f))
+        for grid in f.select({'type': bm.GridBox}):
+            structure.append([child[1:] for child in grid.children])
+    for p in get_layout_plots(figs):
+        structure.append([type(m) for m in [p, p.x_range, p.y_range] + p.below + p.left])
+        #Renderers may share sources, so record which of the plot's sources each renderer uses
+        source_ids = []
+        for r in p.renderers:
+            if r.data_source.id not in source_ids:
+                source_ids.append(r.data_source.id)
+            structure.append([type(m) for m in [r, r.glyph, r.selection_glyph, r.nonselection_glyph, r.hover_glyph, r.muted_glyph] + r.view.filters])
+            structure.append(source_ids.index(r.data_source.id))
+    return structure
+
+def copy_props(model, model_new):
+    '''
+    Set the non-model properties of model to those of model_new. Bokeh only sends the properties that change.
+    '''
+    for key in model_new.properties():
+        if key in ['id', 'js_event_callbacks', 'js_property_callbacks', 'subscribed_events', 'syncable'] or model.lookup(key).property.readonly:
+            continue
+        val = getattr(model_new, key)
+        if isinstance(val, bm.Model) or (isinstance(val, (list, tuple)) and any(isinstance(v, bm.Model) for v in val)):
+            continue
+        setattr(model, key, val)
+
+def sync_figures(figs, figs_new):
+    '''
+    If figs and figs_new have the same structure, move the data and properties of figs_new into the models of figs.
+
+    Args:
+        figs (list): List of bokeh.model.figures (or gridplot of figures) that are currently displayed.
+        figs_new (list): List of bokeh.model.figures (or gridplot of figures) just built by create_figures().
+
+    Returns:
+        (boolean): True if figs were updated, and False if their structure differs from figs_new.
+    '''
+    if get_plot_structure(figs) != get_plot_structure(figs_new):
+        return False
+    for p, p_new in zip(get_layout_plots(figs), get_layout_plots(figs_new)):
+        for m, m_new in zip([p, p.title, p.toolbar, p.x_range, p.y_range] + p.below + p.left, [p_new, p_new.title, p_new.toolbar, p_new.x_range, p_new.y_range] + p_new.below + p_new.left):
+            copy_props(m, m_new)
+        synced_ids = set()
+        for r, r_new in zip(p.renderers, p_new.renderers):
+            if r.data_source.id not in synced_ids:
+                r.data_source.data = dict(r_new.data_source.data)
+                synced_ids.add(r.data_source.id)
+            for g, g_new in zip([r, r.glyph, r.selection_glyph, r.nonselection_glyph, r.hover_glyph, r.muted_glyph] + r.view.filters,
+                                [r_new, r_new.glyph, r_new.selection_glyph, r_new.nonselection_glyph, r_new.hover_glyph, r_new.muted_glyph] + r_new.view.filters):
+                if isinstance(g, bm.Model):
+                    copy_props(g, g_new)
+    return True
+
+def get_gis(reg_name):
+    '''
+    Return the projected map geometry of a region type, from the gis_ (and gis_centroid_, if it exists) files in the
+    'in' folder. The files are read once and the geometry is kept in GL['gis'].
+
+    Args:
+        reg_name (string): Region type, e.g. 'st' or 'rb'.
+
+    Returns:
+        gis (dict): Boundaries have holes removed and are projected to x and y. The boundary points of each
+            group (a contiguous piece of a region) are contiguous, in file order:
+            'x', 'y' (numpy arrays): Coordinates of all boundary points.
+            'groups', 'group_ids' (numpy arrays): Group names and their region ids, in order of first appearance in the file.
+            'offsets' (numpy array): The points of group i are at offsets[i]:offsets[i+1] of 'x' and 'y'.
+            'x_min', 'x_max', 'y_min', 'y_max' (numpy arrays): Bounds of each group.
+            'centroids' (pandas dataframe): Columns 'id', 'x', and 'y' of the region centroids, or None.
+    '''
+    if reg_name in GL['gis']:
+        return GL['gis'][reg_name]
+    df_bound = pd.read_csv(this_dir_path + '/in/gis_' + reg_name + '.csv', sep=',', dtype={'id': object, 'group': object})
+    #Remove holes
+    df_bound = df_bound[df_bound['hole'] == False]
+    codes, groups = pd.factorize(df_bound['group'])
+    order = np.argsort(codes, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(groups)))])
+    x = (df_bound['long'].values*53)[order]
+    y = (df_bound['lat'].values*69)[order]
+    gis = {
+        'x': x,
+        'y': y,
+        'groups': np.asarray(groups, dtype=object),
+        'group_ids': df_bound['id'].values[order][offsets[:-1]],
+        'offsets': offsets,
+        'x_min': np.minimum.reduceat(x, offsets[:-1]),
+        'x_max': np.maximum.reduceat(x, offsets[:-1]),
+        'y_min': np.minimum.reduceat(y, offsets[:-1]),
+        'y_max': np.maximum.reduceat(y, offsets[:-1]),
+        'centroids': None,
+    }
+    centroid_file = this_dir_path + '/in/gis_centroid_' + reg_name + '.csv'
+    if os.path.isfile(centroid_file):
+        centroids = pd.read_csv(centroid_file, sep=',', dtype={'id': object})
+        centroids['x'] = centroids['long']*53
+        centroids['y'] = centroids['lat']*69
+        gis['centroids'] = centroids[['id','x','y']]
+    GL['gis'][reg_name] = gis
+    return gis
 
 def create_maps(df, wdg, cols):
     '''
@@ -1314,30 +2145,30 @@ def create_maps(df, wdg, cols):
             return (maps, breakpoints) #empty list
         reg_name = reg_arr[0]
         map_type = 'line'
-        centroids = pd.read_csv(this_dir_path + '/in/gis_centroid_' + reg_name + '.csv', sep=',', dtype={'id': object})
-        #Add x and y columns to centroids and find x and y ranges
-        centroids['x'] = centroids['long']*53
-        centroids['y'] = centroids['lat']*69
-        centroids = centroids[['id','x','y']]
+        centroids = get_gis(reg_name)['centroids']
         full_joint = x_axis.unique().tolist()
         full_rgs = [i.split('-')[0] for i in full_joint] + [i.split('-')[1] for i in full_joint]
         full_rgs = list(set(full_rgs))
-    #find x and y ranges based on the mins and maxes of the regional boundaries for only regions that
-    #are in the data
-    filepath = this_dir_path + '/in/gis_' + reg_name + '.csv'
-    region_boundaries = pd.read_csv(filepath, sep=',', dtype={'id': object, 'group': object})
-    #Remove holes
-    region_boundaries = region_boundaries[region_boundaries['hole'] == False]
-    #keep only regions that are in df
-    region_boundaries = region_boundaries[region_boundaries['id'].isin(full_rgs)]
-    #Add x and y columns to region_boundaries and find x and y ranges
-    region_boundaries['x'] = region_boundaries['long']*53
-    region_boundaries['y'] = region_boundaries['lat']*69
+    #select the boundary groups of only regions that are in the data, and find x and y ranges from their bounds
+    gis = get_gis(reg_name)
+    sel = np.flatnonzero(pd.Series(gis['group_ids']).isin(full_rgs).values)
+    if len(sel) == 0:
+        logger.info('***Error. None of the regions are in the map.')
+        return (maps, breakpoints) #empty list
     ranges = {
-        'x_max': region_boundaries['x'].max(),
-        'x_min': region_boundaries['x'].min(),
-        'y_max': region_boundaries['y'].max(),
-        'y_min': region_boundaries['y'].min(),
+        'x_max': gis['x_max'][sel].max(),
+        'x_min': gis['x_min'][sel].min(),
+        'y_max': gis['y_max'][sel].max(),
+        'y_min': gis['y_min'][sel].min(),
+    }
+    #Split the boundary points of the selected groups into one array per polygon, using the group offsets.
+    #These are shared by all the maps.
+    lens = np.diff(gis['offsets'])[sel]
+    pts = np.repeat(gis['offsets'][sel] - np.cumsum(lens) + lens, lens) + np.arange(lens.sum())
+    region_boundaries = {
+        'id': gis['group_ids'][sel],
+        'x': np.split(gis['x'][pts], np.cumsum(lens)[:-1]),
+        'y': np.split(gis['y'][pts], np.cumsum(lens)[:-1]),
     }
 
     #Ignore zeros (happens after region_boundaries have been gathered to keep regions with zero)
@@ -1348,12 +2179,12 @@ def create_maps(df, wdg, cols):
     #set breakpoints depending on the binning strategy
     if wdg['map_bin'].value == 'Auto Equal Num': #an equal number of data ponts in each bin
         map_num_bins = int(wdg['map_num'].value)
-        #with full list of values, find uniques with set, and return a sorted list of the uniques
-        val_list = sorted(set(y_axis.tolist()))
+        #sorted array of the unique values
+        val_list = np.unique(y_axis.values)
         #bin indices, find index breakpoints, and convert into value breakpoints.
         index_step = (len(val_list) - 1)/map_num_bins
-        indices = [int((i+1)*index_step) for i in range(map_num_bins - 1)]
-        breakpoints = [val_list[i] for i in indices]
+        indices = (np.arange(1, map_num_bins)*index_step).astype(int)
+        breakpoints = val_list[indices].tolist()
     elif wdg['map_bin'].value == 'Auto Equal Width': #bins of equal width
         map_num_bins = int(wdg['map_num'].value)
         if wdg['map_min'].value != '' and wdg['map_max'].value != '':
@@ -1367,37 +2198,38 @@ def create_maps(df, wdg, cols):
             map_max = y_axis.max() - bin_width
             breakpoints = [map_min + bin_width*i for i in range(map_num_bins - 1)]
     elif wdg['map_bin'].value == 'Manual':
-        breakpoints = [float(bp) for bp in wdg['map_manual'].value.split(',')]
+        #bins are found by binary search, so the breakpoints must be ascending
+        breakpoints = sorted(float(bp) for bp in wdg['map_manual'].value.split(','))
 
     colors_full = get_map_colors(wdg, breakpoints)
 
     df_maps = df.copy()
     #assign all y-values to bins
-    df_maps['bin_index'] = y_axis.apply(get_map_bin_index, args=(breakpoints,))
+    df_maps['bin_index'] = get_map_bin_indices(y_axis.values, breakpoints)
     #If there are only 3 columns (x_axis, y_axis, and bin_index), that means we aren't exploding:
     if len(df_maps.columns) == 3:
         maps.append(create_map(map_type, df_maps, ranges, region_boundaries, centroids, wdg, colors_full))
         logger.info('***Done building map.')
         return (maps, breakpoints) #single map
     #Otherwise we are exploding.
-    #find all unique groups of the explode columns.
-    df_unique = df_maps.copy()
-    #remove x, y, and bin_index
-    df_unique = df_unique[df_unique.columns[0:-3]]
-    df_unique.drop_duplicates(inplace=True)
-    #Loop through rows of df_unique, filter df_maps based on values in each row,
-    #and send filtered dataframe to mapping function
-    for i, row in df_unique.iterrows():
-        df_map = df_maps.copy()
-        title = ''
-        for col in df_unique:
-            df_map = df_map[df_map[col] == row[col]]
-            title = title + col + '=' + str(row[col]) + ', '
+    #Partition df_maps by the explode columns (all but x, y, and bin_index), in order of first appearance.
+    explode_cols = df_maps.columns[0:-3].tolist()
+    df_map_list = []
+    titles = []
+    for explode_vals, df_map in df_maps.groupby(explode_cols if len(explode_cols) > 1 else explode_cols[0], sort=False):
+        explode_vals = explode_vals if len(explode_cols) > 1 else (explode_vals,)
+        titles.append(', '.join(col + '=' + str(val) for col, val in zip(explode_cols, explode_vals)))
         #preserve just x axis, y axis, and bin index
-        df_map = df_map[df_map.columns[-3:]]
-        #remove final comma of title
-        title = title[:-2]
-        maps.append(create_map(map_type, df_map, ranges, region_boundaries, centroids, wdg, colors_full, title))
+        df_map_list.append(df_map[df_map.columns[-3:]].copy())
+    #Build the maps, concurrently if MAP_BUILD_MODE is 'thread'
+    n = len(df_map_list)
+    map_args = ([map_type]*n, df_map_list, [ranges]*n, [region_boundaries]*n, [centroids]*n, [wdg]*n, [colors_full]*n, titles)
+    if MAP_BUILD_MODE == 'thread' and n > 1:
+        with cf.ThreadPoolExecutor(max_workers=MAP_BUILD_WORKERS) as executor:
+            #executor.map() returns maps in the order of df_map_list, regardless of which finishes first.
+            maps += list(executor.map(create_map, *map_args))
+    else:
+        maps += list(map(create_map, *map_args))
     logger.info('***Done building maps.')
     return (maps, breakpoints) #multiple maps
 
@@ -1408,7 +2240,9 @@ def create_map(map_type, df, ranges, region_boundaries, centroids, wdg, colors_f
     Args:
         map_type (string): 'area' or 'line'
         df (pandas dataframe): Input dataframe. First column is regions, second column is values, third column is bin indexes that have been assigned to values.
-        region_boundaries (pandas dataframe): This dataframe has columns for region id, group (if the region has non-contiguous pieces), and x and y values of all boundary points.
+        ranges (dict): Keys are 'x_min', 'x_max', 'y_min', 'y_max' of the map.
+        region_boundaries (dict): Polygons of the regions, with one polygon per group (a contiguous piece of a region). 'id' is an array of the
+            region of each polygon, and 'x' and 'y' are lists of arrays of the x and y values of the boundary points of each polygon.
         centroids (pandas dataframe): Only relevant for a line map, this df has the centroids of all the regions.
         wdg (ordered dict): Dictionary of bokeh model widgets.
         colors_full (list of strings): Colors to shade the map
@@ -1420,30 +2254,24 @@ def create_map(map_type, df, ranges, region_boundaries, centroids, wdg, colors_f
     df_values = df.iloc[:,1].tolist()
     df_bins = df.iloc[:,2].tolist()
 
-    xs = [] #list of lists of x values of boundaries of regions
-    ys = [] #list of lists of y values of boundaries of regions
-    regions = []
-    values = []
-    colors = []
-    for grp in region_boundaries['group'].unique().tolist():
-        region_boundary = region_boundaries[region_boundaries['group'] == grp]
-        xs.append(region_boundary['x'].values.tolist())
-        ys.append(region_boundary['y'].values.tolist())
-        reg = region_boundary['id'].iloc[0]
-        regions.append(reg)
-        if map_type == 'area' and reg in df_regions:
-            index = df_regions.index(reg)
-            value = df_values[index]
-            values.append(value)
-            bin_num = df_bins[index]
-            colors.append(colors_full[int(bin_num)])
-        else:
-            values.append('NA')
-            colors.append('#ffffff')
+    #Join values and bins to the polygons by region, using the first row of each region in df. Regions are matched
+    #as strings, as region columns may be read as numbers (e.g. FIPS codes).
+    #For line maps, and for regions that aren't in df, the polygons are blank.
+    regions = region_boundaries['id']
+    values = np.full(len(regions), 'NA', dtype=object)
+    colors = np.full(len(regions), '#ffffff', dtype=object)
+    if map_type == 'area':
+        df_first = df.iloc[:,1:3].copy()
+        df_first.insert(0, '__region', df.iloc[:,0].astype(str).values)
+        df_first = df_first.drop_duplicates(subset='__region')
+        df_joined = pd.DataFrame({'__id': pd.Series(regions).astype(str).values}).merge(df_first, how='left', left_on='__id', right_on='__region', indicator=True, sort=False)
+        found = (df_joined['_merge'] == 'both').values
+        values[found] = df_joined[df.columns[1]].values[found]
+        colors[found] = np.asarray(colors_full, dtype=object)[df_joined[df.columns[2]].values[found].astype(int)]
 
     source = bms.ColumnDataSource(data=dict(
-        x=xs,
-        y=ys,
+        x=region_boundaries['x'],
+        y=region_boundaries['y'],
         region=regions,
         value=values,
         color=colors,
@@ -1508,30 +2336,35 @@ def create_map(map_type, df, ranges, region_boundaries, centroids, wdg, colors_f
         if wdg['map_arrows'].value == 'Yes':
             #For arrow maps, negative values in the data are converted into positives in the
             #opposite direction (in set_df_plots()), so negative values should no longer exist.
-            for i,x in enumerate(xs):
-                x_end = xs[i][0] + float(wdg['map_arrow_loc'].value)*(xs[i][1] - xs[i][0])
-                y_end = ys[i][0] + float(wdg['map_arrow_loc'].value)*(ys[i][1] - ys[i][0])
-                fig_map.add_layout(bm.Arrow(x_start=xs[i][0], y_start=ys[i][0], x_end=x_end, y_end=y_end, line_alpha=0,
-                    end=bm.OpenHead(size=float(wdg['map_arrow_size'].value),line_color=colors[i], line_width=float(wdg['map_line_width'].value), line_alpha=float(wdg['map_opacity'].value)),
-                ))
+            #All arrow heads of the map are drawn by one Arrow annotation, with a row per line in its source.
+            arrow_loc = float(wdg['map_arrow_loc'].value)
+            x_start = df['from_x'].values
+            y_start = df['from_y'].values
+            arrow_source = bms.ColumnDataSource(data=dict(
+                x_start=x_start,
+                y_start=y_start,
+                x_end=x_start + arrow_loc*(df['to_x'].values - x_start),
+                y_end=y_start + arrow_loc*(df['to_y'].values - y_start),
+                color=colors,
+            ))
+            fig_map.add_layout(bm.Arrow(x_start='x_start', y_start='y_start', x_end='x_end', y_end='y_end', source=arrow_source, line_alpha=0,
+                end=bm.OpenHead(size=float(wdg['map_arrow_size'].value), line_color='color', line_width=float(wdg['map_line_width'].value), line_alpha=float(wdg['map_opacity'].value)),
+            ))
     return fig_map
 
-def get_map_bin_index(val, breakpoints):
+def get_map_bin_indices(vals, breakpoints):
     '''
-    Helper function for determining the bin number for a given value and set of breakpoints.
+    Helper function for determining the bin numbers for an array of values and a set of ascending breakpoints.
     This assumes that bin ranges are less than or equal to the upper value and
     strictly greater than the lower value.
 
     Args:
-        val (float): The value that is to be binned
+        vals (numpy array of float): The values that are to be binned
         breakpoints (list of float): Breakpoints that separate the color-shaded bins.
     Returns:
-        bin index (int): the bin number that will determine the color of the region.
+        bin indices (numpy array of int): the bin numbers that will determine the colors of the regions.
     '''
-    for i, breakpoint in enumerate(breakpoints):
-        if val <= breakpoint:
-            return i
-    return len(breakpoints)
+    return np.searchsorted(np.asarray(breakpoints, dtype=float), vals, side='left')
 
 
 def build_map_legend(wdg, breakpoints):
@@ -1712,84 +2545,94 @@ def display_config(wdg, wdg_defaults):
                 output += '<div class="config-display-item"><span class="config-display-key">' + label + ': </span>' + item_string + '</div>'
     return output
 
-def apply_aggregation(group, agg_method, y_a, y_b, y_c, wdg_range):
+def apply_aggregation(df, groupby_cols, agg_method, y_a, y_b, y_c, wdg_range):
     """
-    Helper function for pandas dataframe groupby object with apply function.
+    Aggregate a dataframe by groups with vectorized groupby sums, means, mins and maxes.
+    Products like a*b are computed once for the whole dataframe before grouping.
 
     Args:
-        group (pandas dataframe): This has the data required for aggregations.
+        df (pandas dataframe): This has the data required for aggregations.
+        groupby_cols (list): Columns to group by.
         agg_method (string): The aggregation method to apply.
         y_a (string): Name of the primary (a) column for which an aggregation is calculated.
         y_b (string): Name of column used for b factor in aggregation method.
         y_c (string): Name of column used for c factor in aggregation method.
         wdg_range (string): If within-series ranges are to be added, this will be 'Within Series'.
     Returns:
-        (dataframe): The returned aggregation result, including series min and max if within-series range is to be added.
+        (dataframe): The groupby columns and the aggregation result, including series min and max if within-series range is to be added.
     """
-    a = group[y_a]
-    agg_result = None
-    try:
-        if agg_method == 'sum(a)':
-            agg_result = a.sum()
-        elif agg_method == 'ave(a)':
-            agg_result = a.mean()
-        elif agg_method == 'sum(a)/sum(b)':
-            b = group[y_b]
-            agg_result = a.sum() / b.sum()
-        elif agg_method == 'sum(a*b)/sum(b)':
-            b = group[y_b]
-            agg_result = (a * b).sum() / b.sum()
-        elif agg_method == 'sum(a*b)/sum(c)':
-            b = group[y_b]
-            c = group[y_c]
-            agg_result = (a * b).sum() / c.sum()
-        elif agg_method == '[sum(a*b)/sum(b)]/[sum(a*c)/sum(c)]':
-            b = group[y_b]
-            c = group[y_c]
-            agg_result = ((a * b).sum() / b.sum())/((a * c).sum() / c.sum())
-    except ZeroDivisionError:
-        return pd.DataFrame({y_a: [None]})
+    a = df[y_a]
+    terms = {'a': a}
+    if agg_method == 'sum(a)/sum(b)':
+        terms['b'] = df[y_b]
+    elif agg_method == 'sum(a*b)/sum(b)':
+        terms['ab'] = a * df[y_b]
+        terms['b'] = df[y_b]
+    elif agg_method == 'sum(a*b)/sum(c)':
+        terms['ab'] = a * df[y_b]
+        terms['c'] = df[y_c]
+    elif agg_method == '[sum(a*b)/sum(b)]/[sum(a*c)/sum(c)]':
+        terms['ab'] = a * df[y_b]
+        terms['b'] = df[y_b]
+        terms['ac'] = a * df[y_c]
+        terms['c'] = df[y_c]
+    df_terms = pd.DataFrame({'__' + k: v for k, v in terms.items()})
+    for col in groupby_cols:
+        df_terms[col] = df[col]
+    aggs = {k: ('__' + k, 'mean' if agg_method == 'ave(a)' and k == 'a' else 'sum') for k in terms}
     if wdg_range == 'Within Series':
-        return pd.DataFrame({y_a: [agg_result], 'range_min': [a.min()], 'range_max': [a.max()]})
+        aggs['range_min'] = ('__a', 'min')
+        aggs['range_max'] = ('__a', 'max')
+    g = df_terms.groupby(groupby_cols, sort=False, observed=True).agg(**aggs)
+    if agg_method == 'sum(a)/sum(b)':
+        g[y_a] = g['a'] / g['b']
+    elif agg_method == 'sum(a*b)/sum(b)':
+        g[y_a] = g['ab'] / g['b']
+    elif agg_method == 'sum(a*b)/sum(c)':
+        g[y_a] = g['ab'] / g['c']
+    elif agg_method == '[sum(a*b)/sum(b)]/[sum(a*c)/sum(c)]':
+        g[y_a] = (g['ab'] / g['b']) / (g['ac'] / g['c'])
     else:
-        return pd.DataFrame({y_a: [agg_result]})
+        g[y_a] = g['a']
+    range_cols = ['range_min', 'range_max'] if wdg_range == 'Within Series' else []
+    return g[[y_a] + range_cols].reset_index()
 
-def op_with_base(group, op, col, col_base, y_val):
+def op_with_base(df, groups, op, col, col_base, y_val):
     """
-    Helper function for pandas dataframe groupby object with apply function. This returns a pandas
-    dataframe with an operation applied to one of the columns.
+    Apply an operation to the y-axis column across the operating column, within groups of the other columns.
+    Each base is computed for all groups at once: the named base value by broadcasting each group's
+    first base row, "Consecutive" with groupby.shift, and "Total" with groupby.transform('sum').
 
     Args:
-        group (pandas dataframe): This has columns required for performing the operation
+        df (pandas dataframe): This has columns required for performing the operation
+        groups (pandas series): Like-indexed group number of each row.
         op (string): The type of operation: 'Difference', 'Ratio'
         col (string): The column across which the operation is happening
         col_base (string): The value of col to be used as the base for the operation, or "Consecutive" or "Total"
         y_val (string): Name of column that will be modified according to the operation.
     Returns:
-        group_out (pandas dataframe): A like-indexed dataframe with the specified operations.
+        (pandas series): A like-indexed series of y_val with the specified operations.
     """
-    group_out = group.copy()
+    y = df[y_val]
+    y_grouped = y.groupby(groups, sort=False)
     if col_base == 'Consecutive':
-        if op == 'Difference':
-            group_out[y_val] = group[y_val] - group[y_val].shift()
-        elif op == 'Ratio':
-            group_out[y_val] = group[y_val] / group[y_val].shift()
+        y_base = y_grouped.shift()
     elif col_base == 'Total':
-        if op == 'Difference':
-            group_out[y_val] = group[y_val] - group[y_val].sum()
-        elif op == 'Ratio':
-            group_out[y_val] = group[y_val] / group[y_val].sum()
+        y_base = y_grouped.transform('sum')
     else:
-        df_base = group[group[col]==col_base]
-        if df_base.empty:
-            y_base = 0
-        else:
-            y_base = df_base[y_val].iloc[0]
-        if op == 'Difference':
-            group_out[y_val] = group[y_val] - y_base
-        elif op == 'Ratio':
-            group_out[y_val] = group[y_val] / y_base if y_base else 0
-    return group_out
+        #position of the first row of each group with the base value, broadcast to the rows of the group
+        pos = pd.Series(np.arange(len(df)), index=df.index).where(df[col] == col_base)
+        pos = pos.groupby(groups, sort=False).transform('min')
+        y_base = pd.Series(np.where(pos.notnull(), y.to_numpy()[pos.fillna(0).astype(int)], 0), index=df.index)
+        if op == 'Ratio':
+            #a missing or zero base gives zero ratios
+            has_base = y_base.astype(bool)
+            return (y / y_base.where(has_base)).where(has_base, 0)
+    if op == 'Difference':
+        return y - y_base
+    elif op == 'Ratio':
+        return y / y_base
+    return y
 
 def prettify_numbers(number_list):
     str_list = []
@@ -1842,7 +2685,7 @@ def update_data_source(init_load=False, init_config={}):
         pass
     elif data_type == 'CSV':
         GL['widgets'].update(get_wdg_csv())
-        GL['df_source'], GL['columns'] = get_df_csv(path)
+        GL['df_source'], GL['columns'] = get_df_csv(path, GL['load_filters'].get(None, {}), GL['custom_sorts'])
         GL['widgets'].update(build_widgets(GL['df_source'], GL['columns'], init_load, init_config, wdg_defaults=GL['wdg_defaults']))
     elif data_type == 'GDX':
         GL['widgets'].update(get_wdg_gdx(path, GL['widgets']))
@@ -1932,16 +2775,35 @@ def update_plots():
         GL['plots'].children = []
         return
 
-    GL['df_plots'] = set_df_plots(GL['df_source'], GL['columns'], GL['widgets'], GL['custom_sorts'])
+    GL['df_plots'] = set_df_plots(GL['df_source'], GL['columns'], GL['widgets'], GL['custom_sorts'], GL['stage_cache'])
     if GL['widgets']['render_plots'].value == 'Yes':
-        if GL['widgets']['chart_type'].value in ['Line Map','Area Map']:
+        wdg = GL['widgets']
+        state = GL['figure_state']
+        fig_key = tuple(wdg[w].value for w in WDG_COL + WDG_NON_COL if w not in STYLE_WDG) + (repr(GL['custom_sorts']), repr(GL['custom_colors']))
+        struct_key = tuple(wdg[w].value for w in STRUCTURE_WDG)
+        styles = {w: wdg[w].value for w in STYLE_WDG}
+        figs_current = ('figs' in state and wdg['chart_type'].value not in ['Line Map','Area Map'] and
+            len(state['figs']) == len(GL['plots'].children) and all(f is c for f, c in zip(state['figs'], GL['plots'].children)))
+        #If the data and all non-style widgets are the same as when the current figures were built, patch their styles
+        if (figs_current and state['df_plots'] is GL['df_plots'] and state['key'] == fig_key and float(state['styles']['opacity']) != 0 and
+                not (wdg['explode_grid'].value == 'Yes' and styles['bokeh_tools'] != state['styles']['bokeh_tools'])):
+            patch_figures(GL['plots'].children, wdg, state['styles'])
+            state['styles'] = styles
+            return
+        if wdg['chart_type'].value in ['Line Map','Area Map']:
             figs, breakpoints = create_maps(GL['df_plots'], GL['widgets'], GL['columns'])
             legend_text = build_map_legend(GL['widgets'], breakpoints)
         else:
             figs = create_figures(GL['df_plots'], GL['widgets'], GL['columns'], GL['custom_colors'])
             legend_text = build_plot_legend(GL['df_plots'], GL['widgets'], GL['custom_sorts'], GL['custom_colors'])
         GL['widgets']['legend'].text = legend_text
-        GL['plots'].children = figs
+        #If the chart structure hasn't changed (e.g. only filters have), move the new data and properties into the current
+        #figure, glyph, and source models, so the browser gets new column arrays instead of a new document
+        if figs_current and state['struct_key'] == struct_key and sync_figures(GL['plots'].children, figs):
+            figs = list(GL['plots'].children)
+        else:
+            GL['plots'].children = figs
+        GL['figure_state'] = {'df_plots': GL['df_plots'], 'key': fig_key, 'struct_key': struct_key, 'styles': styles, 'figs': figs}
 
 def download_url(dir_path='', auto_open=True):
     '''
@@ -13,6 +13,9 @@ import os
 import pandas as pd
 import numpy as np
 import collections
+import json
+import hashlib
+import tempfile
 import core
 import copy
 from pdb import set_trace as pdbst
@@ -33,6 +36,9 @@ BOKEH_VS_DEBUG=True
 ###################################################
 
 rb_globs = {'output_subdir':'/outputs/', 'test_file':'BP.csv', 'report_subdir':'/reeds2'}
+#Results index files (see get_results_index()), kept in core.cache_path
+INDEX_SUFFIX = '_index.json'
+INDEX_VERSION = 2
 this_dir_path = os.path.dirname(os.path.realpath(__file__))
 df_deflator = pd.read_csv(os.path.abspath(os.path.join(os.path.dirname(__file__), 'deflator.csv')), index_col=0)
 coststreams = ['eq_gasaccounting_regional','eq_gasaccounting_national','eq_bioused','eq_gasused','eq_objfn_inv','eq_objfn_op']
@@ -1736,59 +1742,165 @@ def generate_results_meta(runs_folder):
             print(f"   -> Key added: {key}")
         return meta_entries
 
-    # Iterate over all files in the folder
+    # Iterate over all files in the results index of the folder. Identical outputs (same file name
+    # and columns) in multiple scenario folders produce identical metadata, so only the first of each is used.
     print(f"Scanning folder: {runs_folder}")
-    for root, _, files in os.walk(runs_folder):
-        for file in files:
-            if file == 'BP.csv':
-                print(f"Skipping file: {file}")
-                continue
-
-            if file.endswith('.csv'):
-                file_path = os.path.join(root, file)
-                print(f"Processing file: {file_path}")
-
-                try:
-                    df = pd.read_csv(file_path)
-                    print(f"  Loaded CSV successfully. Columns: {list(df.columns)}")
-                except Exception as e:
-                    print(f"  Error loading {file_path}: {e}")
-                    continue
-
-                # Remove duplicate columns that are unwanted (e.g., 'Dim1', 'Year', 'Month', 'Day', 'Hour')
-                relevant_columns = ['tech', 'year', 'month', 'day', 'hour']
-                all_columns = df.columns.tolist()
-
-                # Only keep the relevant columns and drop duplicates
-                value_columns = [
-                    col for col in all_columns
-                    if col not in relevant_columns and 'year' not in col.lower() and col != 'Dim1'
-                ]
-                print(f"  Identified value columns: {value_columns}")
+    seen_schemas = set()
+    for file_path, entry in get_results_index(runs_folder).items():
+        root, file = os.path.split(file_path)
+        print(f"Processing file: {file_path}")
+        all_columns = entry['columns']
+
+        schema = (file, tuple(all_columns))
+        if schema in seen_schemas:
+            print(f"  Skipping {file}: Schema already scanned.")
+            continue
+        seen_schemas.add(schema)
+
+        # Remove duplicate columns that are unwanted (e.g., 'Dim1', 'Year', 'Month', 'Day', 'Hour')
+        relevant_columns = ['tech', 'year', 'month', 'day', 'hour']
+
+        # Only keep the relevant columns and drop duplicates
+        value_columns = [
+            col for col in all_columns
+            if col not in relevant_columns and 'year' not in col.lower() and col != 'Dim1'
+        ]
+        print(f"  Identified value columns: {value_columns}")
 
-                if not value_columns:
-                    print(f"  Skipping {file}: No value columns found.")
-                    continue
+        if not value_columns:
+            print(f"  Skipping {file}: No value columns found.")
+            continue
 
-                # Final columns list to be used for metadata creation
-                columns = relevant_columns + value_columns
-                meta_entries = create_granularity_meta(file, root, columns)
-                for key, meta in meta_entries:
-                    results_meta[key] = meta
-                    print(f"  -> Metadata entry added for key: {key}")
+        # Final columns list to be used for metadata creation
+        columns = relevant_columns + value_columns
+        meta_entries = create_granularity_meta(file, root, columns)
+        for key, meta in meta_entries:
+            results_meta[key] = meta
+            print(f"  -> Metadata entry added for key: {key}")
 
     print(f"Finished generating metadata. Total keys: {len(results_meta)}")
     return results_meta
 
+def get_results_index_path(runs_folder):
+    '''
+    Return the path of the results index file of runs_folder. Index files are kept in core.cache_path rather than
+    in the users' run directories, and are named by a hash of the absolute path of runs_folder.
+    '''
+    runs_folder = os.path.abspath(runs_folder)
+    key = hashlib.sha1(runs_folder.encode('utf-8')).hexdigest()
+    return os.path.join(core.cache_path, os.path.basename(runs_folder) + '-' + key + INDEX_SUFFIX)
+
+def get_results_index(runs_folder):
+    '''
+    Return the columns of every csv output file in runs_folder, rescanning only the files whose size or
+    modification time differ from the results index file of runs_folder (see get_results_index_path()).
+    The index file is updated if any files were rescanned, added, or removed.
+
+    Args:
+        runs_folder (string): Path to a ReEDS run folder or a folder containing ReEDS run folders.
+
+    Returns:
+        files (ordered dict): Keys are csv file paths. Values are dicts with 'size', 'mtime', and 'columns'
+            (see scan_csv_schema()).
+    '''
+    index_path = get_results_index_path(runs_folder)
+    index = {}
+    if os.path.isfile(index_path):
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+        except ValueError as e:
+            print(f"  Ignoring unreadable results index {index_path}: {e}")
+    index_files = index.get('files', {}) if index.get('version') == INDEX_VERSION else {}
+    files = collections.OrderedDict()
+    new_index_files = {}
+    changed = False
+    for root, _, filenames in os.walk(runs_folder):
+        for file in filenames:
+            if file == rb_globs['test_file'] or not file.endswith('.csv'):
+                continue
+            file_path = os.path.join(root, file)
+            rel_path = os.path.relpath(file_path, runs_folder)
+            stat = os.stat(file_path)
+            entry = index_files.get(rel_path)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                print(f"  Scanning {file_path}")
+                try:
+                    entry = scan_csv_schema(file_path, stat)
+                except Exception as e:
+                    print(f"  Error loading {file_path}: {e}")
+                    continue
+                changed = True
+            files[file_path] = entry
+            new_index_files[rel_path] = entry
+    if changed or len(new_index_files) != len(index_files):
+        #write to a uniquely named temporary file first, so processes refreshing the same index don't share a file
+        tmp_file = None
+        try:
+            if not os.path.isdir(core.cache_path):
+                os.makedirs(core.cache_path)
+            fd, tmp_file = tempfile.mkstemp(suffix='.tmp', dir=core.cache_path)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': INDEX_VERSION, 'files': new_index_files}, f)
+            os.replace(tmp_file, index_path)
+        except OSError as e:
+            print(f"  Could not write results index {index_path}: {e}")
+            if tmp_file is not None and os.path.isfile(tmp_file):
+                os.remove(tmp_file)
+    return files
+
+def scan_csv_schema(file_path, stat):
+    '''
+    Read the header of a csv file for the results index. None of its rows are parsed.
+
+    Args:
+        file_path (string): Path to the csv file.
+        stat (os.stat_result): Result of os.stat() on file_path, used to record its size and modification time.
+
+    Returns:
+        entry (dict): 'size' and 'mtime' of the file, and 'columns' (list of column names).
+    '''
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'columns': pd.read_csv(file_path, nrows=0).columns.tolist(),
+    }
+
+def get_results_meta(runs_folders):
+    '''
+    Generate results_meta for a list of run folders, sorted alphabetically by result name.
+    '''
+    results_meta = collections.OrderedDict()
+    for folder in runs_folders:
+        for key, meta in generate_results_meta(folder).items():
+            results_meta.setdefault(key, meta)
+
+    # Printing the generated results_meta
+    print("\nFinal results_meta structure:")
+    for key, value in results_meta.items():
+        print(f"Key: {key}, Value: {value}")
+
+    #Sort alphabetically
+    return collections.OrderedDict(sorted(results_meta.items()))
+
+def refresh_results_meta(runs_folders):
+    '''
+    Regenerate results_meta from a new list of run folders, e.g. when the data source changes.
+    Unchanged output files are not re-read (see get_results_index()).
+    '''
+    global results_meta
+    results_meta = get_results_meta(runs_folders)
 
-# Example usage
 runs_folder = '../runs'  # Directory containing the subfolders with CSV files
-results_meta = generate_results_meta(runs_folder)
-
-# Printing the generated results_meta
-print("\nFinal results_meta structure:")
-for key, value in results_meta.items():
-    print(f"Key: {key}, Value: {value}")
 
-#Sort alphabetically
-results_meta = collections.OrderedDict(sorted(results_meta.items()))
+def __getattr__(name):
+    '''
+    Build results_meta on first access rather than when this module is imported, so that
+    importing reeds2 does not scan runs_folder. After the first access, results_meta is an
+    ordinary module global and this function is no longer called for it.
+    '''
+    global results_meta
+    if name == 'results_meta':
+        results_meta = get_results_meta([runs_folder])
+        return results_meta
+    raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
@@ -15,6 +15,8 @@ import sys
 import reeds2 as rd2
 import core
 import datetime
+import traceback
+import concurrent.futures as cf
 import subprocess as sp
 if sys.version_info[0] == 2:
     import gdx2py
@@ -29,11 +31,16 @@ DEFAULT_DOLLAR_YEAR = 2021
 DEFAULT_PV_YEAR = 2022
 DEFAULT_DISCOUNT_RATE = .05
 DEFAULT_END_YEAR = 2050
+#How get_reeds_data() loads scenarios: 'serial', 'thread' (thread pool), or 'process' (process pool).
+#SCENARIO_LOAD_WORKERS is the maximum number of workers, or None for the concurrent.futures default.
+SCENARIO_LOAD_MODE = 'thread'
+SCENARIO_LOAD_WORKERS = None
 
 #ReEDS globals
 #scenarios: each element is a dict with name of scenario and path to scenario
 #result_dfs: keys are ReEDS result names. Values are dataframes for that result (with 'scenario' as one of the columns)
-GL_REEDS = {'scenarios': [], 'result_dfs': {}}
+#scenario_dfs: keys are ReEDS result names. Values are dicts with scenario names as keys and dataframes of the result for that scenario as values.
+GL_REEDS = {'scenarios': [], 'result_dfs': {}, 'scenario_dfs': {}}
 GLRD = {}
 GLDT = ''
 reeds = None
@@ -178,6 +185,7 @@ def get_wdg_reeds(path, init_load, wdg_config, wdg_defaults, custom_sorts, custo
 
     #Filter Scenarios widgets and Result widget
     scenarios = []
+    meta_folders = [] #folders that are scanned for results metadata
     runs_paths = path.split('|')
     for runs_path in runs_paths:
         runs_path = runs_path.replace('"', '')
@@ -195,6 +203,7 @@ def get_wdg_reeds(path, init_load, wdg_config, wdg_defaults, custom_sorts, custo
                     if os.path.isfile(abs_path_scen + GLRD['output_subdir'] + GLRD['test_file']):
                         custom_sorts['scenario'].append(scen['name'])
                         scenarios.append({'name': scen['name'], 'path': abs_path_scen})
+                        meta_folders.append(abs_path_scen)
                         if 'color' in df_scen:
                             custom_colors['scenario'][scen['name']] = scen['color']
         #Else if the path is pointing to a directory, check if the directory is a run folder
@@ -202,6 +211,7 @@ def get_wdg_reeds(path, init_load, wdg_config, wdg_defaults, custom_sorts, custo
         #run folders, so gather all of those scenarios.
         elif os.path.isdir(runs_path):
             abs_path = str(os.path.abspath(runs_path))
+            meta_folders.append(abs_path)
             if os.path.isfile(abs_path + GLRD['output_subdir'] + GLRD['test_file']):
                 scenarios.append({'name': os.path.basename(abs_path), 'path': abs_path})
             else:
@@ -214,6 +224,8 @@ def get_wdg_reeds(path, init_load, wdg_config, wdg_defaults, custom_sorts, custo
     for key in ["scenario_filter_dropdown", "scenario_filter", "result"]:
         topwdg.pop(key, None)
     if scenarios:
+        #Only output files that changed since the last scan of these folders are re-read.
+        reeds.refresh_results_meta(meta_folders)
         labels = [a['name'] for a in scenarios]
         topwdg['scenario_filter_dropdown'] = bmw.Div(text='Filter Scenarios', css_classes=['scenario-filter-dropdown'])
         topwdg['scenario_filter_sel_all'] = bmw.Button(label='Select All', button_type='success', css_classes=['scenario-filter-drop','select-all-none'], visible=False)
@@ -259,75 +271,154 @@ def scenario_filter_select_all():
 def scenario_filter_select_none():
     core.GL['widgets']['scenario_filter'].active = []
 
-def get_reeds_data(topwdg, scenarios, result_dfs):
+def get_reeds_data(topwdg, scenarios, result_dfs, scenario_dfs):
     '''
-    For a selected ReEDS result and set of scenarios, fetch gdx data,
-    preprocess it, and add to global result_dfs dictionary if the data
-    hasn't already been fetched.
+    For a selected ReEDS result and set of scenarios, fetch gdx data and
+    preprocess it for scenarios that haven't already been fetched, and
+    combine the active scenarios into the global result_dfs dictionary.
 
     Args:
         topwdg (ordered dict): ReEDS widgets (meta widgets, scenarios widget, result widget)
         scenarios (array of dicts): Each element is a dict with name of scenario and path to scenario.
         result_dfs (dict): Keys are ReEDS result names. Values are dataframes for that result (with 'scenario' as one of the columns)
+        scenario_dfs (dict): Keys are ReEDS result names. Values are dicts with scenario names as keys and dataframes
+            of the result for that scenario as values. Scenarios stay here when they are deselected, so reselecting them is free.
 
     Returns:
-        Nothing: result_dfs is modified
+        Nothing: result_dfs and scenario_dfs are modified
     '''
     result = topwdg['result'].value
     logger.info('***Fetching ' + str(result) + ' for selected scenarios...')
     startTime = datetime.datetime.now()
-    #A result has been selected, so either we retrieve it from result_dfs,
-    #which is a dict with one dataframe for each result, or we make a new key in the result_dfs
-    if result not in result_dfs:
-        result_dfs[result] = None
-        cur_scenarios = []
-    else:
-        cur_scenarios = result_dfs[result]['scenario'].unique().tolist() #the scenarios that have already been retrieved and stored in result_dfs
-        #remove scenarios that are not ative
-        active_scenarios = [scenarios[i]['name'] for i in topwdg['scenario_filter'].active]
-        result_dfs[result] = result_dfs[result][result_dfs[result]['scenario'].isin(active_scenarios)]
-
-    #For each selected scenario, retrieve the data from gdx if we don't already have it,
-    #and update result_dfs with the new data.
+    scen_dfs = scenario_dfs.setdefault(result, {})
+    active_scenarios = [scenarios[i] for i in topwdg['scenario_filter'].active]
     result_meta = reeds.results_meta[result]
-    for i in topwdg['scenario_filter'].active:
-        scenario_name = scenarios[i]['name']
-        if scenario_name not in cur_scenarios:
-            #get the gdx result and preprocess
-            if 'sources' in result_meta:
-                #If we have multiple parameters as data sources, we must gather them all, and the first preprocess
-                #function (which is necessary) will accept a dict of dataframes and return a combined dataframe.
-                df_scen_result = {}
-                for src in result_meta['sources']:
-                    df_scen_result[src['name']] = get_src(scenarios[i], src)
-            else:
-                #else we have only one parameter as a data source
-                df_scen_result = get_src(scenarios[i], result_meta)
-            #preprocess and return one dataframe
-            if 'preprocess' in result_meta:
-                for preprocess in result_meta['preprocess']:
-                    df_scen_result = preprocess['func'](df_scen_result, **preprocess['args'])
-            #preprocess columns in this dataframe
-            for col in df_scen_result.columns.values.tolist():
-                if col in reeds.columns_meta and 'preprocess' in reeds.columns_meta[col]:
-                    for preprocess in reeds.columns_meta[col]['preprocess']:
-                        df_scen_result[col] = preprocess(df_scen_result[col])
-            df_scen_result['scenario'] = scenario_name
-            if result_dfs[result] is None:
-                result_dfs[result] = df_scen_result
-            else:
-                result_dfs[result] = pd.concat([result_dfs[result], df_scen_result]).reset_index(drop=True)
-        logger.info('***Done fetching ' + str(result) + ' for ' + str(scenario_name) + '.')
-
-    #fill missing values with 0:
-    df = result_dfs[result]
+    row_filter = get_reeds_row_filter(topwdg, result_meta, core.GL['load_filters'].get(result, {}))
+    if 'scenario' in row_filter:
+        scen_labels = row_filter.pop('scenario')
+        active_scenarios = [scen for scen in active_scenarios if scen['name'] in scen_labels]
+
+    #For each selected scenario, retrieve the data from gdx if we don't already have it.
+    new_scenarios = [scen for scen in active_scenarios if scen['name'] not in scen_dfs]
+    for scen, (df_scen_result, error) in zip(new_scenarios, load_scenario_results(new_scenarios, result_meta, row_filter)):
+        if error is not None:
+            logger.info('***Error fetching ' + str(result) + ' for ' + str(scen['name']) + ':\n' + error)
+            continue
+        df_scen_result['scenario'] = scen['name']
+        scen_dfs[scen['name']] = df_scen_result
+        logger.info('***Done fetching ' + str(result) + ' for ' + str(scen['name']) + '.')
+
+    #Combine the active scenarios with a single concat
+    dfs = [scen_dfs[scen['name']] for scen in active_scenarios if scen['name'] in scen_dfs]
+    if not dfs:
+        result_dfs.pop(result, None)
+        raise ValueError('Unable to fetch ' + str(result) + ' for any of the selected scenarios.')
+    df = pd.concat(dfs, ignore_index=True)
+    result_dfs[result] = df
+
+    #combine duplicate index rows. Missing values are filled with 0 after filtering (see core.fill_missing)
     if 'index' in result_meta:
         idx_cols = ['scenario'] + result_meta['index']
-        df =  df.groupby(idx_cols, sort=False, as_index =False).sum()
-        full_idx = pd.MultiIndex.from_product([df[col].unique().tolist() for col in idx_cols], names=idx_cols)
-        result_dfs[result] = df.set_index(idx_cols).reindex(full_idx).reset_index()
+        result_dfs[result] = df.groupby(idx_cols, sort=False, as_index =False).sum()
     logger.info('***Done fetching ' + str(result) + ': ' + str(datetime.datetime.now() - startTime))
 
+def get_reeds_row_filter(topwdg, result_meta, load_filter):
+    '''
+    Translate the load filter of a result (see core.get_load_filters()) into a filter of the rows of each
+    scenario as it is fetched. Filter labels are display values, so the labels of mapped columns are extended with
+    the raw values that map to them. Only columns that process_reeds_data() makes filterable are included. For results
+    with an 'index', only the columns of the missing-value fill (scenario and the index columns) are included,
+    because core.fill_missing() limits the levels of those columns to the active filters anyway.
+
+    Args:
+        topwdg (ordered dict): ReEDS widgets (meta widgets, scenarios widget, result widget)
+        result_meta (dict): Metadata of the result, from results_meta.
+        load_filter (dict): Keys are column names and values are lists of filter labels.
+
+    Returns:
+        row_filter (dict): Keys are column names and values are lists of labels and raw values to keep.
+    '''
+    row_filter = {}
+    for col, labels in load_filter.items():
+        meta = reeds.columns_meta.get(col, {})
+        if 'index' in result_meta and col not in ['scenario'] + result_meta['index']:
+            continue
+        if col != 'scenario' and not (meta.get('filterable') == True or (meta.get('type') == 'string' and meta.get('filterable') != False)):
+            continue
+        row_filter[col] = list(labels)
+        if 'meta_map_'+col in topwdg and topwdg['meta_map_'+col].value != '':
+            df_map = pd.read_csv(topwdg['meta_map_'+col].value.replace('"',''))
+            row_filter[col] += df_map['raw'][df_map['display'].astype(str).isin(labels)].astype(str).tolist()
+    return row_filter
+
+def load_scenario_results(scens, result_meta, row_filter={}):
+    '''
+    Fetch and preprocess a ReEDS result for a list of scenarios, concurrently if SCENARIO_LOAD_MODE is
+    'thread' or 'process'.
+
+    Args:
+        scens (list of dicts): Scenarios to load. Each is a dict with name of scenario and path to scenario.
+        result_meta (dict): Metadata of the result, from results_meta.
+        row_filter (dict): Optional filter of the rows of each scenario. See get_reeds_row_filter().
+
+    Returns:
+        results (list of tuples): (df_scen_result, error) for each scenario, in the same order as scens.
+            See fetch_scenario_result().
+    '''
+    if SCENARIO_LOAD_MODE not in ['thread', 'process'] or len(scens) < 2:
+        return [fetch_scenario_result(scen, result_meta, GLDT, row_filter) for scen in scens]
+    if SCENARIO_LOAD_MODE == 'process':
+        executor = cf.ProcessPoolExecutor(max_workers=SCENARIO_LOAD_WORKERS)
+    else:
+        executor = cf.ThreadPoolExecutor(max_workers=SCENARIO_LOAD_WORKERS)
+    with executor:
+        #executor.map() returns results in the order of scens, regardless of which finishes first.
+        return list(executor.map(fetch_scenario_result, scens, [result_meta]*len(scens), [GLDT]*len(scens), [row_filter]*len(scens)))
+
+def fetch_scenario_result(scen, result_meta, data_type, row_filter={}):
+    '''
+    Fetch and preprocess a ReEDS result for one scenario. This is a module-level function so that it can run
+    in a worker process, where the data type globals must be set again.
+
+    Args:
+        scen (dict): Scenario dictionary. Keys are 'name' and 'path'.
+        result_meta (dict): Metadata of the result, from results_meta.
+        data_type (string): The data type, used to set globals (see set_globs_by_type()).
+        row_filter (dict): Optional filter of the rows of the result. Rows are dropped after preprocessing,
+            before the scenarios are combined and mapped. See get_reeds_row_filter().
+
+    Returns:
+        df_scen_result (pandas dataframe): The preprocessed result, or None if there was an error.
+        error (string): The traceback of the error, or None if there was no error.
+    '''
+    if GLDT != data_type:
+        set_globs_by_type(data_type)
+    try:
+        #get the gdx result and preprocess
+        if 'sources' in result_meta:
+            #If we have multiple parameters as data sources, we must gather them all, and the first preprocess
+            #function (which is necessary) will accept a dict of dataframes and return a combined dataframe.
+            df_scen_result = {}
+            for src in result_meta['sources']:
+                df_scen_result[src['name']] = get_src(scen, src)
+        else:
+            #else we have only one parameter as a data source
+            df_scen_result = get_src(scen, result_meta)
+        #preprocess and return one dataframe
+        if 'preprocess' in result_meta:
+            for preprocess in result_meta['preprocess']:
+                df_scen_result = preprocess['func'](df_scen_result, **preprocess['args'])
+        #preprocess columns in this dataframe
+        for col in df_scen_result.columns.values.tolist():
+            if col in reeds.columns_meta and 'preprocess' in reeds.columns_meta[col]:
+                for preprocess in reeds.columns_meta[col]['preprocess']:
+                    df_scen_result[col] = preprocess(df_scen_result[col])
+        if row_filter:
+            df_scen_result = df_scen_result[core.get_filter_mask(df_scen_result, row_filter)].reset_index(drop=True)
+    except Exception:
+        return (None, traceback.format_exc())
+    return (df_scen_result, None)
+
 def get_src(scen, src):
     '''
     For a given scenario and data source, fetch gdx or csv data and do common
@@ -347,9 +438,9 @@ def get_src(scen, src):
         df_src.columns = src['columns']
     elif src['file'].endswith('.csv'):
         if 'header' in src and src['header'] == None:
-            df_src = pd.read_csv(filepath, low_memory=False, header=None)
+            df_src = core.read_csv_cached(filepath, low_memory=False, header=None)
         else:
-            df_src = pd.read_csv(filepath, low_memory=False)
+            df_src = core.read_csv_cached(filepath, low_memory=False)
         if 'transpose' in src and src['transpose'] == True:
             df_src = df_src.T
         if 'columns' in src:
@@ -364,7 +455,7 @@ def get_src(scen, src):
 def process_reeds_data(topwdg, custom_sorts, custom_colors, result_dfs):
     '''
     Apply joins, mappings, ordering data to a selected result dataframe.
-    Also categorize the columns of the dataframe and fill NA values.
+    Also categorize the columns of the dataframe, fill NA values, and encode discrete columns as categoricals.
 
     Args:
         topwdg (ordered dict): ReEDS widgets (meta widgets, scenarios widget, result widget)
@@ -379,6 +470,10 @@ def process_reeds_data(topwdg, custom_sorts, custom_colors, result_dfs):
     logger.info('***Apply joins, maps, ordering to ReEDS data...')
     startTime = datetime.datetime.now()
     df = result_dfs[topwdg['result'].value].copy()
+    result_meta = reeds.results_meta[topwdg['result'].value]
+    fill_cols = ['scenario'] + result_meta['index'] if 'index' in result_meta else []
+    fill_counts = {}
+    fill_keys = {}
     #apply joins
     for col in df.columns.values.tolist():
         if 'meta_join_'+col in topwdg and topwdg['meta_join_'+col].value != '':
@@ -392,6 +487,9 @@ def process_reeds_data(topwdg, custom_sorts, custom_colors, result_dfs):
             #many to many instead of many to one. For example, if the source data regionality is state, texas will be
             #assigned to just one rto after removing duplicates, even though it is truly part of multiple rtos.
             df_join.drop_duplicates(subset=col, inplace=True)
+            for c in df_join.columns.values.tolist():
+                if c != col:
+                    fill_keys[c] = col
             #merge df_join into df
             df = pd.merge(left=df, right=df_join, on=col, sort=False)
 
@@ -401,6 +499,9 @@ def process_reeds_data(topwdg, custom_sorts, custom_colors, result_dfs):
             df_map = pd.read_csv(topwdg['meta_map_'+col].value.replace('"',''))
             #now map from raw to display
             map_dict = dict(zip(list(df_map['raw']), list(df_map['display'])))
+            #the missing-value fill needs to know how many raw values end up as each display value
+            if col in fill_cols:
+                fill_counts[col] = pd.Series(df[col].unique()).replace(map_dict).value_counts().to_dict()
             df[col] = df[col].replace(map_dict)
 
     #apply custom styling
@@ -439,10 +540,16 @@ def process_reeds_data(topwdg, custom_sorts, custom_colors, result_dfs):
                          [x for x in cols['continuous'] if x in reeds.columns_meta and 'filterable' in reeds.columns_meta[x] and reeds.columns_meta[x]['filterable']==True])
     cols['seriesable'] = ([x for x in cols['discrete'] if not (x in reeds.columns_meta and 'seriesable' in reeds.columns_meta[x] and reeds.columns_meta[x]['seriesable']==False)]+
                          [x for x in cols['continuous'] if x in reeds.columns_meta and 'seriesable' in reeds.columns_meta[x] and reeds.columns_meta[x]['seriesable']==True])
+    #columns along which missing values are filled with 0 after filtering (see core.fill_missing)
+    cols['fill'] = [x for x in fill_cols if x in cols['all']]
+    cols['fill_counts'] = fill_counts
+    cols['fill_keys'] = {c: key for c, key in fill_keys.items() if c in cols['all'] and key in cols['fill']}
 
     #fill NA depending on column type
     df[cols['discrete']] = df[cols['discrete']].fillna('{BLANK}')
     df[cols['continuous']] = df[cols['continuous']].fillna(0)
+    for col in cols['discrete']:
+        df[col] = core.get_categorical(df[col], custom_sorts.get(col, []))
     logger.info('***Done with joins, maps, ordering: ' + str(datetime.datetime.now() - startTime))
     return (df, cols)
 
@@ -475,12 +582,13 @@ def update_data_source(path, init_load, init_config, data_type):
     '''
     set_globs_by_type(data_type)
     GL_REEDS['result_dfs'] = {}
+    GL_REEDS['scenario_dfs'] = {}
     GL_REEDS['scenarios'] = []
     core.GL['variant_wdg'], GL_REEDS['scenarios'] = get_wdg_reeds(path, init_load, init_config, core.GL['wdg_defaults'], core.GL['custom_sorts'], core.GL['custom_colors'])
     core.GL['widgets'].update(core.GL['variant_wdg'])
     #if this is the initial load, we need to build the rest of the widgets if we've selected a result.
     if init_load and core.GL['variant_wdg']['result'].value is not 'None':
-        get_reeds_data(core.GL['variant_wdg'], GL_REEDS['scenarios'], GL_REEDS['result_dfs'])
+        get_reeds_data(core.GL['variant_wdg'], GL_REEDS['scenarios'], GL_REEDS['result_dfs'], GL_REEDS['scenario_dfs'])
         core.GL['df_source'], core.GL['columns'] = process_reeds_data(core.GL['variant_wdg'], core.GL['custom_sorts'], core.GL['custom_colors'], GL_REEDS['result_dfs'])
         preset_options = []
         if 'presets' in reeds.results_meta[core.GL['variant_wdg']['result'].value]:
@@ -564,13 +672,14 @@ def update_reeds_wdg(wdg_type):
     core.GL['widgets'].update(core.GL['variant_wdg'])
     if wdg_type == 'vars':
         GL_REEDS['result_dfs'] = {}
+        GL_REEDS['scenario_dfs'] = {}
     for key in list(core.GL['wdg_defaults'].keys()):
         if key not in list(core.GL['variant_wdg'].keys()) + ['data']:
             core.GL['wdg_defaults'].pop(key, None)
     if 'result' in core.GL['variant_wdg'] and core.GL['variant_wdg']['result'].value is not 'None':
         preset_options = []
         if wdg_type in ['result','vars']:
-            get_reeds_data(core.GL['variant_wdg'], GL_REEDS['scenarios'], GL_REEDS['result_dfs'])
+            get_reeds_data(core.GL['variant_wdg'], GL_REEDS['scenarios'], GL_REEDS['result_dfs'], GL_REEDS['scenario_dfs'])
         if 'presets' in reeds.results_meta[core.GL['variant_wdg']['result'].value]:
             preset_options = list(reeds.results_meta[core.GL['variant_wdg']['result'].value]['presets'].keys())
         core.GL['df_source'], core.GL['columns'] = process_reeds_data(core.GL['variant_wdg'], core.GL['custom_sorts'], core.GL['custom_colors'], GL_REEDS['result_dfs'])